@@ -1,25 +1,23 @@
 import time
-import PCA9685
+from servo_bus import get_bus
 
 """
 This class provides a simple interface to control a servo motor using the PWM Hat on a Raspberry Pi.
 The PWM Hat connects with I2C and has a PCA9685 chip that allows for 16 channels of PWM output.
+Servos on the same chip share one ServoBus so several turrets can batch their writes.
 """
 
-pwm = PCA9685.PCA9685(0x40, debug=False)
-pwm.setPWMFreq(50)  # Set frequency to 50Hz for servos
-
 class HATServo:
-    def __init__(self, channel, min_pulse=500, max_pulse=2500):
+    def __init__(self, channel, min_pulse=500, max_pulse=2500, bus=None):
         """
         Initializes the HWServo object.
 
-        :param pwm_chip: PWM chip number (default: 0)
-        :param pwm_channel: PWM channel number (default: 0)
-        :param min_duty: Minimum duty cycle in nanoseconds (default: 1000000 for 1ms pulse)
-        :param max_duty: Maximum duty cycle in nanoseconds (default: 2000000 for 2ms pulse)
-        :param frequency: PWM frequency in Hz (default: 50Hz for servos)
+        :param channel: PCA9685 channel number (0-15)
+        :param min_pulse: Minimum pulse width in microseconds (default: 500)
+        :param max_pulse: Maximum pulse width in microseconds (default: 2500)
+        :param bus: ServoBus to write through (default: the shared bus for the chip at 0x40)
         """
+        self.bus = bus or get_bus()
         self.channel = channel
         self.min_pulse = min_pulse
         self.max_pulse = max_pulse
@@ -35,7 +33,13 @@ class HATServo:
         :param angle: Desired servo angle in degrees (-90 to 90)
         """
         self.current_angle = max(-90, min(90, angle))
-        pwm.setServoPulse(self.channel, self._angle_to_pulse(self.current_angle))
+        self.bus.set_pulse(self.channel, self._angle_to_pulse(self.current_angle))
+
+    def set_pulse_range(self, min_pulse, max_pulse):
+        """ Changes the pulse range (microseconds) and moves to the current angle under the new range. """
+        self.min_pulse = min_pulse
+        self.max_pulse = max_pulse
+        self.set_angle(self.current_angle)
 
     def adjust_angle(self, increment):
         """ Increments the current angle by the specified amount. """
@@ -58,7 +62,7 @@ class HATServo:
 
     def disable(self):
         """ Disables the PWM output. """
-        pwm.setPWM(self.channel, 0, 0)  # Set duty cycle to 0
+        self.bus.disable(self.channel)  # Set duty cycle to 0
 
     def cleanup(self):
         """ Disables and unexports the PWM channel. """
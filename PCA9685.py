@@ -25,10 +25,15 @@ class PCA9685:
   __ALLLED_OFF_L       = 0xFC
   __ALLLED_OFF_H       = 0xFD
 
+  __MODE1_AI           = 0x20
+  # SMBus block writes carry at most 32 bytes, 4 registers per channel
+  MAX_BLOCK_CHANNELS   = 8
+
   def __init__(self, address=0x40, debug=False):
     self.bus = smbus.SMBus(1)
     self.address = address
     self.debug = debug
+    self.autoIncrement = False
     if (self.debug):
       print("Reseting PCA9685")
     self.write(self.__MODE1, 0x00)
@@ -76,6 +81,21 @@ class PCA9685:
     if (self.debug):
       print("channel: %d  LED_ON: %d LED_OFF: %d" % (channel,on,off))
 	  
+  def setPWMs(self, channel, offs, on=0):
+    "Sets consecutive PWM channels starting at channel in a single I2C transaction"
+    if len(offs) > self.MAX_BLOCK_CHANNELS:
+      raise ValueError("At most %d channels per block write" % self.MAX_BLOCK_CHANNELS)
+    if not self.autoIncrement:
+      # Register auto increment lets one block write cover several channels
+      self.write(self.__MODE1, (self.read(self.__MODE1) & 0x7F) | self.__MODE1_AI)
+      self.autoIncrement = True
+    data = []
+    for off in offs:
+      data += [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+    self.bus.write_i2c_block_data(self.address, self.__LED0_ON_L+4*channel, data)
+    if (self.debug):
+      print("channels: %d-%d  LED_ON: %d LED_OFF: %s" % (channel, channel+len(offs)-1, on, offs))
+
   def setServoPulse(self, channel, pulse):
     "Sets the Servo Pulse,The PWM frequency must be 50HZ"
     pulse = pulse*4096/20000        #PWM frequency is 50HZ,the period is 20000us
@@ -0,0 +1,158 @@
+import sys
+import time
+
+import cv2
+
+from picamera2 import CompletedRequest, MappedArray, Picamera2
+from picamera2.encoders import JpegEncoder
+from picamera2.outputs import FileOutput
+from libcamera import Transform
+from picamera2.devices.imx500 import IMX500, NetworkIntrinsics
+from picamera2.devices.imx500.postprocess import COCODrawer
+from picamera2.devices.imx500.postprocess_highernet import \
+    postprocess_higherhrnet
+
+from turret_state_machine import TurretState, TurretStateMachine
+from postprocess_gate import PostprocessGate
+
+WINDOW_SIZE_H_W = (480, 640)
+
+"""
+One AI camera: runs pose estimation on the IMX500, draws the overlay for its turret and
+encodes the result for the web stream.  Each turret in the process gets its own pipeline.
+"""
+
+class CameraPipeline:
+    def __init__(self, model, camera_id='', fps=None, labels=None, detection_threshold=0.1):
+        """
+        Loads the network for one camera. This must happen before the camera is opened.
+
+        :param model: Path of the .rpk network
+        :param camera_id: Which IMX500 to use when there is more than one ('' for the first)
+        :param fps: Inference rate, defaults to the network's own
+        :param labels: Path to the labels file
+        :param detection_threshold: Post-process detection threshold
+        """
+        # Skips post-processing on frames that can't hold a target
+        self.postprocess = PostprocessGate(postprocess_higherhrnet, WINDOW_SIZE_H_W,
+                                           detection_threshold=detection_threshold,
+                                           target_score=TurretStateMachine.TARGET_SCORE)
+        self.draw_keypoints = True
+        self.turret = None
+        self.governor = None
+        self.picam2 = None
+        self.encoder = None
+        self.base_jpeg_quality = None
+
+        self.imx500 = IMX500(model, camera_id)
+        intrinsics = self.imx500.network_intrinsics
+        if not intrinsics:
+            intrinsics = NetworkIntrinsics()
+            intrinsics.task = "pose estimation"
+        elif intrinsics.task != "pose estimation":
+            print("Network is not a pose estimation task", file=sys.stderr)
+            exit()
+
+        if labels is not None:
+            with open(labels, 'r') as f:
+                intrinsics.labels = f.read().splitlines()
+        if fps is not None:
+            intrinsics.inference_rate = fps
+
+        # Defaults
+        if intrinsics.inference_rate is None:
+            intrinsics.inference_rate = 10
+        if intrinsics.labels is None:
+            with open("assets/coco_labels.txt", "r") as f:
+                intrinsics.labels = f.read().splitlines()
+        intrinsics.update_with_defaults()
+        self.intrinsics = intrinsics
+
+        categories = [c for c in intrinsics.labels if c and c != "-"]
+        self.drawer = COCODrawer(categories, self.imx500, needs_rescale_coords=False)
+
+    @property
+    def detection_threshold(self):
+        return self.postprocess.detection_threshold
+
+    @detection_threshold.setter
+    def detection_threshold(self, value):
+        self.postprocess.detection_threshold = value
+
+    def start(self, output):
+        """ Opens the camera, starts inference and sends the encoded frames to output. """
+        self.picam2 = Picamera2(self.imx500.camera_num)
+        config = self.picam2.create_preview_configuration(controls={'FrameRate': self.intrinsics.inference_rate},
+                                                          transform=Transform(hflip=True), buffer_count=12)
+
+        self.imx500.show_network_fw_progress_bar()
+        self.picam2.start(config, show_preview=False)
+        self.imx500.set_auto_aspect_ratio()
+        self.picam2.pre_callback = self.camera_callback
+
+        self.encoder = JpegEncoder()
+        self.picam2.start_recording(self.encoder, FileOutput(output))
+        self.base_jpeg_quality = self.encoder.q
+
+    def stop(self):
+        if self.picam2:
+            self.picam2.stop()
+            self.picam2.close()
+            self.picam2 = None
+
+    def detections(self):
+        """ Returns a copy of the latest (keypoints, boxes, scores) for the control loop. """
+        return self.postprocess.detections()
+
+    def camera_callback(self, request: CompletedRequest):
+        """Parse the output tensor into a number of detected objects, scaled to the ISP output."""
+        start = time.perf_counter()
+        np_outputs = self.imx500.get_outputs(metadata=request.get_metadata(), add_batch=True)
+        if np_outputs is not None:
+            self.postprocess.process(np_outputs)
+
+        self.draw(request)
+        if self.governor:
+            self.governor.record_callback_time(time.perf_counter() - start)
+
+    def draw(self, request: CompletedRequest, stream='main'):
+        """Draw the detections for this request onto the ISP output."""
+        turret = self.turret
+        with MappedArray(request, stream) as m:
+            keypoints = self.postprocess.results()[0]
+            if keypoints is not None and self.draw_keypoints:
+                for kp in keypoints:
+                    self.drawer.draw_keypoints(m.array, kp, 0.05, request.get_metadata(), self.picam2, stream)
+
+            if turret is None:
+                return
+
+            if turret.aim_point is not None:
+                aimPointX, aimPointY = turret.aim_point
+                cv2.circle(m.array, (aimPointX, aimPointY), 5, (0, 255, 0), -1)
+                cv2.line(m.array, (aimPointX, 0), (aimPointX, WINDOW_SIZE_H_W[0]), (0, 255, 0), 1)
+                cv2.line(m.array, (0, aimPointY), (WINDOW_SIZE_H_W[1], aimPointY), (0, 255, 0), 1)
+                # Target square
+                color = (255, 0, 0) if turret.state == TurretState.FIRING  \
+                   else (0, 0, 255) if turret.state == TurretState.LOCKED  \
+                   else (0, 255, 0)
+                cv2.rectangle(m.array, (320 - turret.AIM_WINDOW_SIZE, 240 - turret.AIM_WINDOW_SIZE), \
+                                       (320 + turret.AIM_WINDOW_SIZE, 240 + turret.AIM_WINDOW_SIZE), \
+                                       color,  1)
+
+            # Draw the turret mode on the image
+            cv2.putText(m.array, f"{turret.state.name}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            # Put arm/disarm text
+            if turret.armed:
+                cv2.putText(m.array, "ARMED", (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2)
+            else:
+                cv2.putText(m.array, "DISARMED", (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+
+    def apply_governor_level(self, level):
+        """Apply a governor level to the stream quality, overlay and camera frame rate."""
+        frame_rate = max(1, self.intrinsics.inference_rate * level.inference_scale)
+        self.encoder.q = level.jpeg_quality if level.jpeg_quality is not None else self.base_jpeg_quality
+        # Skip frames at the encoder, encoding is what costs CPU, not sending to the viewers
+        self.encoder.frame_skip_count = max(1, round(frame_rate / level.stream_fps)) if level.stream_fps else 1
+        self.draw_keypoints = level.draw_keypoints
+        self.picam2.set_controls({'FrameRate': frame_rate})
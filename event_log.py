@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from enum import IntEnum
+
+import numpy as np
+
+"""
+A low overhead event log for the control loop.
+Records go into a preallocated ring buffer of fixed size structured records so logging from the
+control thread never allocates or touches a file.  A background thread drains the buffer to
+a rotating binary file that can be read back with read_events().
+Every file starts with a small header giving the format version, an existing file in another format
+(or from before the header) is rotated out instead of having new records appended to it.
+"""
+
+class LogLevel(IntEnum):
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    OFF = 100
+
+class EventType(IntEnum):
+    TRANSITION = 1
+    AIM = 2
+    FIRE = 3
+
+EVENT_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('turret', 'u1'),
+    ('level', 'u1'),
+    ('event', 'u1'),
+    ('state', 'u1'),
+    ('new_state', 'u1'),
+    ('aim_x', '<i2'),
+    ('aim_y', '<i2'),
+    ('yaw_p', '<f4'), ('yaw_i', '<f4'), ('yaw_d', '<f4'),
+    ('pitch_p', '<f4'), ('pitch_i', '<f4'), ('pitch_d', '<f4'),
+    ('yaw_angle', '<f4'),
+    ('pitch_angle', '<f4'),
+])
+
+FORMAT_VERSION = 2  # 2 added the turret field
+HEADER_MAGIC = b'PYTRTLOG'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('itemsize', '<u4')])
+
+
+def _header():
+    return np.array([(HEADER_MAGIC, FORMAT_VERSION, EVENT_DTYPE.itemsize)], dtype=HEADER_DTYPE).tobytes()
+
+
+def _has_current_header(path):
+    with open(path, 'rb') as f:
+        return f.read(HEADER_DTYPE.itemsize) == _header()
+
+
+class EventLog:
+    def __init__(self, path="events.bin", level=LogLevel.INFO, capacity=4096,
+                 max_bytes=4 * 1024 * 1024, backup_count=3, flush_interval=0.5):
+        """
+        Initializes the EventLog object.
+
+        :param path: File the records are written to, rotated to path.1, path.2, ...
+        :param level: Records below this level are dropped before they reach the buffer
+        :param capacity: Number of records held in the ring buffer
+        :param max_bytes: Size at which the file is rotated
+        :param backup_count: Number of rotated files to keep
+        :param flush_interval: Seconds between drains of the ring buffer
+        """
+        self.path = path
+        self.level = LogLevel(level)
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._buffer = np.zeros(capacity, dtype=EVENT_DTYPE)
+        # Only the control thread advances _head and only the writer advances _tail,
+        # so the hot path doesn't need a lock
+        self._head = 0
+        self._tail = 0
+        self._file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set_level(self, level):
+        """ Changes the minimum level that gets recorded, safe to call from any thread. """
+        if isinstance(level, str):
+            level = LogLevel[level.upper()]
+        self.level = LogLevel(level)
+
+    def record(self, level, event, state=0, new_state=0, aim_point=(-1, -1),
+               yaw_terms=(0, 0, 0), pitch_terms=(0, 0, 0), yaw_angle=0, pitch_angle=0, turret=0):
+        """ Adds a record to the ring buffer, meant to be called from a single (control) thread. """
+        if level < self.level:
+            return
+        # If the writer has fallen behind this overwrites the oldest record rather than blocking
+        head = self._head
+        self._buffer[head % self.capacity] = (
+            time.time(), turret, level, event, state, new_state, aim_point[0], aim_point[1],
+            yaw_terms[0], yaw_terms[1], yaw_terms[2],
+            pitch_terms[0], pitch_terms[1], pitch_terms[2],
+            yaw_angle, pitch_angle)
+        self._head = head + 1
+
+    def start(self):
+        """ Starts the background writer thread. """
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stops the writer thread after a final drain. """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def flush(self):
+        """ Writes everything in the ring buffer out to the file. """
+        head = self._head
+        tail = self._tail
+        if head == tail:
+            return
+        if head - tail > self.capacity:
+            self.dropped += head - tail - self.capacity
+            tail = head - self.capacity
+        start = tail % self.capacity
+        end = head % self.capacity
+        if start < end:
+            data = self._buffer[start:end].tobytes()
+        else:
+            data = self._buffer[start:].tobytes() + self._buffer[:end].tobytes()
+        self._tail = head
+        self._write(data)
+
+    def _write(self, data):
+        if self._file is None:
+            self._open()
+        if self._file.tell() + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+
+    def _open(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0 and not _has_current_header(self.path):
+            # Left by an older version, appending to it would make the whole file unreadable
+            self._rotate()
+            return
+        self._file = open(self.path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(_header())
+
+    def _rotate(self):
+        if self._file:
+            self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'ab')
+        self._file.write(_header())
+
+
+def read_events(path):
+    """
+    Reads a file written by EventLog back into a numpy structured array.
+
+    :raises ValueError: if the file isn't an event log in the current format
+    """
+    if not _has_current_header(path):
+        raise ValueError(f"{path} is not an event log in format version {FORMAT_VERSION}")
+    return np.fromfile(path, dtype=EVENT_DTYPE, offset=HEADER_DTYPE.itemsize)
+
+
+# Benchmark the hot path
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = EventLog(os.path.join(tmp, "events.bin"), level=LogLevel.DEBUG, capacity=1 << 16).start()
+        count = 200000
+        start = time.perf_counter()
+        for i in range(count):
+            log.record(LogLevel.DEBUG, EventType.AIM, 2, 0, (320, 240),
+                       (1.5, 0.2, -0.1), (0.5, 0.1, 0.0), 12.5, 15.0)
+        elapsed = time.perf_counter() - start
+        log.stop()
+        print(f"record(): {elapsed / count * 1e6:.2f} us per record")
+
+        log.set_level(LogLevel.INFO)
+        start = time.perf_counter()
+        for i in range(count):
+            log.record(LogLevel.DEBUG, EventType.AIM)
+        elapsed = time.perf_counter() - start
+        print(f"record() below level: {elapsed / count * 1e6:.2f} us per record")
+        print(f"{len(read_events(log.path))} records written, {log.dropped} dropped")
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+"""
+Small helper to run a callback whenever files under a set of paths change.
+Uses inotify (through the optional inotify_simple package) when it is installed so
+there is no polling on the pi, and falls back to checking modification times once a second.
+"""
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+
+class FileWatcher:
+    def __init__(self, paths, callback, poll_interval=1.0, settle_time=0.05):
+        """
+        Initializes the FileWatcher object.
+
+        :param paths: Files and/or directories to watch (directories are watched recursively)
+        :param callback: Called with no arguments after any of the paths change
+        :param poll_interval: Seconds between mtime checks when inotify isn't available
+        :param settle_time: Seconds to wait after an event so editors can finish writing
+        """
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """ Starts watching on a daemon thread. """
+        target = self._watch_inotify if INotify is not None else self._watch_poll
+        # Snapshot before returning so changes made right after start() aren't missed
+        self._last = self._snapshot()
+        self._thread = threading.Thread(target=target, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stops the watcher thread (the inotify thread exits on its next event or timeout). """
+        self._stop.set()
+
+    def _watch_inotify(self):
+        inotify = INotify()
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE
+        watched_dirs = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                # inotify watches aren't recursive, watch every directory underneath too
+                for root, _, _ in os.walk(path):
+                    watched_dirs[inotify.add_watch(root, mask)] = root
+            else:
+                # Watch the containing directory for files so atomic rename-over saves are seen too
+                inotify.add_watch(os.path.dirname(path), mask)
+        names = {os.path.basename(p) for p in self.paths if not os.path.isdir(p)}
+        while not self._stop.is_set():
+            events = inotify.read(timeout=1000)
+            if not events:
+                continue
+            time.sleep(self.settle_time)
+            events += inotify.read(timeout=0)
+            for e in events:
+                if e.wd in watched_dirs and e.mask & flags.ISDIR and e.mask & (flags.CREATE | flags.MOVED_TO):
+                    self._watch_new_dir(inotify, mask, watched_dirs, os.path.join(watched_dirs[e.wd], e.name))
+            # Directory watches report any file; file watches only care about their own name
+            if any(e.wd in watched_dirs or e.name in names for e in events):
+                self._fire()
+        inotify.close()
+
+    def _watch_new_dir(self, inotify, mask, watched_dirs, path):
+        for root, _, _ in os.walk(path):
+            try:
+                watched_dirs[inotify.add_watch(root, mask)] = root
+            except OSError:
+                # Removed again before we got to it
+                pass
+
+    def _watch_poll(self):
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            if current != self._last:
+                self._last = current
+                self._fire()
+
+    def _snapshot(self):
+        snapshot = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    for name in files:
+                        self._stat_into(snapshot, os.path.join(root, name))
+            else:
+                self._stat_into(snapshot, path)
+        return snapshot
+
+    @staticmethod
+    def _stat_into(snapshot, path):
+        try:
+            snapshot[path] = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            # Editors create and delete temp files all the time, one can vanish between listing and stat
+            pass
+
+    def _fire(self):
+        try:
+            self.callback()
+        except Exception as e:
+            print(f"File watcher callback failed: {e}")
@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+
+"""
+Thermal and load aware performance governor.
+Samples the CPU temperature, frequency, load average and camera callback time and steps the
+turret's optional work down when the pi is under stress: stream frame rate and JPEG quality first,
+then overlay detail, then the inference rate.  The control loop is never touched.
+Every viewer costs a copy of the stream, so with more than max_viewers connected the stream is kept
+at least at the first reduced level whatever the temperature.
+All files are read relative to sysfs_root so a fake tree can stand in for the real one.
+"""
+
+class GovernorLevel:
+    def __init__(self, name, stream_fps=None, jpeg_quality=None, draw_keypoints=True, inference_scale=1.0):
+        """
+        One step of the governor.
+
+        :param name: Name shown when the level changes
+        :param stream_fps: Max frames per second encoded for the stream (None for every frame)
+        :param jpeg_quality: JPEG quality for the stream (None for the encoder default)
+        :param draw_keypoints: Whether the pose keypoints are drawn on the stream
+        :param inference_scale: Fraction of the configured inference rate to run at
+        """
+        self.name = name
+        self.stream_fps = stream_fps
+        self.jpeg_quality = jpeg_quality
+        self.draw_keypoints = draw_keypoints
+        self.inference_scale = inference_scale
+
+    def __repr__(self):
+        return f"GovernorLevel({self.name})"
+
+# Ordered from no throttling to the most throttling
+DEFAULT_LEVELS = [
+    GovernorLevel("normal"),
+    GovernorLevel("stream_reduced", stream_fps=5, jpeg_quality=70),
+    GovernorLevel("stream_minimal", stream_fps=2, jpeg_quality=50),
+    GovernorLevel("overlay_reduced", stream_fps=2, jpeg_quality=50, draw_keypoints=False),
+    GovernorLevel("inference_reduced", stream_fps=2, jpeg_quality=50, draw_keypoints=False, inference_scale=0.5),
+]
+
+class Governor:
+    def __init__(self, sysfs_root="/", on_change=None, levels=None, interval=2.0,
+                 hot_temp=75.0, cool_temp=65.0, max_load=0.8, max_callback_time=0.05,
+                 throttle_ratio=0.75, escalate_samples=2, recover_samples=5, viewer_count=None,
+                 max_viewers=3, cpus=None):
+        """
+        Initializes the Governor object.
+
+        :param sysfs_root: Root the /sys and /proc paths are read from
+        :param on_change: Called with the new GovernorLevel whenever the level changes
+        :param levels: Ordered list of GovernorLevels (default: DEFAULT_LEVELS)
+        :param interval: Seconds between samples
+        :param hot_temp: CPU temperature (C) considered stressed
+        :param cool_temp: CPU temperature (C) the pi must be under before stepping back up
+        :param max_load: 1 minute load average per CPU considered stressed
+        :param max_callback_time: Average camera callback time (s) considered stressed
+        :param throttle_ratio: Frequency below this fraction of max while busy counts as throttled
+        :param escalate_samples: Stressed samples in a row before stepping down
+        :param recover_samples: Calm samples in a row before stepping back up
+        :param viewer_count: Called with no arguments to get the number of stream viewers
+        :param max_viewers: More viewers than this keeps the stream at a reduced level
+        :param cpus: CPU count the load average is divided by (default: read from sysfs_root)
+        """
+        self.sysfs_root = sysfs_root
+        self.on_change = on_change
+        self.levels = levels or DEFAULT_LEVELS
+        self.interval = interval
+        self.hot_temp = hot_temp
+        self.cool_temp = cool_temp
+        self.max_load = max_load
+        self.max_callback_time = max_callback_time
+        self.throttle_ratio = throttle_ratio
+        self.escalate_samples = escalate_samples
+        self.recover_samples = recover_samples
+        self.viewer_count = viewer_count
+        self.max_viewers = max_viewers
+        self.cpus = cpus
+        self.level_index = 0
+        self.callback_time = 0.0
+        self.last_sample = {}
+        self._stressed_count = 0
+        self._calm_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def level(self):
+        return self.levels[self.level_index]
+
+    def record_callback_time(self, seconds):
+        """ Feeds in how long a camera callback took, kept as a moving average. """
+        self.callback_time += 0.1 * (seconds - self.callback_time)
+
+    def _path(self, *parts):
+        return os.path.join(self.sysfs_root, *parts)
+
+    def _read_number(self, *parts):
+        try:
+            with open(self._path(*parts)) as f:
+                return float(f.read().split()[0])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def cpu_count(self):
+        """ Number of online CPUs under sysfs_root, e.g. "0-3" or "0,2-3" in cpu/online. """
+        if self.cpus is not None:
+            return self.cpus
+        try:
+            with open(self._path("sys", "devices", "system", "cpu", "online")) as f:
+                count = 0
+                for part in f.read().strip().split(","):
+                    first, _, last = part.partition("-")
+                    count += int(last or first) - int(first) + 1
+                return count
+        except (OSError, ValueError):
+            return os.cpu_count() or 1
+
+    def sample(self):
+        """ Reads the current temperature, frequency and load. Missing values come back as None. """
+        temp = self._read_number("sys", "class", "thermal", "thermal_zone0", "temp")
+        cur_freq = self._read_number("sys", "devices", "system", "cpu", "cpu0", "cpufreq", "scaling_cur_freq")
+        max_freq = self._read_number("sys", "devices", "system", "cpu", "cpu0", "cpufreq", "cpuinfo_max_freq")
+        load = self._read_number("proc", "loadavg")
+        return {
+            'temp': temp / 1000 if temp is not None else None,  # millidegrees
+            'cur_freq': cur_freq,
+            'max_freq': max_freq,
+            'load': load / self.cpu_count() if load is not None else None,
+            'callback_time': self.callback_time,
+            'viewers': self.viewer_count() if self.viewer_count else None,
+        }
+
+    def is_stressed(self, s):
+        if s['temp'] is not None and s['temp'] >= self.hot_temp:
+            return True
+        if s['load'] is not None and s['load'] >= self.max_load:
+            return True
+        if s['callback_time'] >= self.max_callback_time:
+            return True
+        # Busy but running well under max clock means the firmware is throttling us
+        if s['cur_freq'] and s['max_freq'] and s['load'] is not None and s['load'] >= self.max_load / 2:
+            return s['cur_freq'] < s['max_freq'] * self.throttle_ratio
+        return False
+
+    def is_calm(self, s):
+        if s['temp'] is not None and s['temp'] > self.cool_temp:
+            return False
+        if s['load'] is not None and s['load'] >= self.max_load * 0.75:
+            return False
+        return s['callback_time'] < self.max_callback_time * 0.75
+
+    def min_level_index(self, s):
+        """ Lowest level the viewer count allows, the first step down only touches the stream. """
+        if s['viewers'] is not None and s['viewers'] > self.max_viewers:
+            return min(1, len(self.levels) - 1)
+        return 0
+
+    def update(self):
+        """ Takes one sample and moves at most one level. Returns the current level. """
+        s = self.sample()
+        self.last_sample = s
+        floor = self.min_level_index(s)
+        if self.level_index < floor:
+            self._set_level(floor, s)
+            return self.level
+        if self.is_stressed(s):
+            self._stressed_count += 1
+            self._calm_count = 0
+            if self._stressed_count >= self.escalate_samples and self.level_index < len(self.levels) - 1:
+                self._set_level(self.level_index + 1, s)
+        elif self.is_calm(s):
+            self._calm_count += 1
+            self._stressed_count = 0
+            if self._calm_count >= self.recover_samples and self.level_index > floor:
+                self._set_level(self.level_index - 1, s)
+        else:
+            # In between the thresholds, hold where we are
+            self._stressed_count = 0
+            self._calm_count = 0
+        return self.level
+
+    def _set_level(self, index, s):
+        self.level_index = index
+        self._stressed_count = 0
+        self._calm_count = 0
+        print(f"Governor level: {self.level.name} (temp={s['temp']}, load={s['load']}, "
+              f"callback={s['callback_time'] * 1000:.1f}ms, viewers={s['viewers']})")
+        if self.on_change:
+            self.on_change(self.level)
+
+    def start(self):
+        """ Starts sampling on a daemon thread. """
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.update()
+            except Exception as e:
+                print(f"Governor update failed: {e}")
+
+# Example usage
+if __name__ == "__main__":
+    import sys
+
+    governor = Governor(sysfs_root=sys.argv[1] if len(sys.argv) > 1 else "/")
+    while True:
+        level = governor.update()
+        print(level.name, governor.last_sample)
+        time.sleep(governor.interval)
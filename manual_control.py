@@ -0,0 +1,97 @@
+import threading
+import time
+
+"""
+Hands manual aim commands from the web server to the control loop.
+The browser can send commands faster than the servos can use them so they are coalesced into
+a single command per control tick: the aim deltas are summed and a fire request is kept until
+it has been applied, so a quick tap of the button is never lost.
+Latency is measured from when the server receives a command to when the servos have been written.
+For a merged command that is from the oldest part of it, which is the part that waited longest.
+"""
+
+class ManualCommand:
+    def __init__(self, yaw=0.0, pitch=0.0, fire=False, received_at=None):
+        self.yaw = yaw
+        self.pitch = pitch
+        self.fire = fire
+        self.received_at = received_at if received_at is not None else time.perf_counter()
+        self.count = 1
+
+
+class ManualControl:
+    MAX_STEP = 10  # Largest yaw/pitch change (degrees) applied in one tick
+
+    def __init__(self, wakeup=None):
+        """
+        :param wakeup: Optional threading.Event set whenever a command arrives, so a loop
+                       serving several turrets can wait on one event
+        """
+        self.wakeup = wakeup
+        self._pending = None
+        self._condition = threading.Condition()
+        self.commands_received = 0
+        self.commands_coalesced = 0
+        self.ticks = 0
+        self.last_latency = None
+        self.average_latency = None
+        self.max_latency = 0.0
+
+    def submit(self, yaw, pitch, fire=False):
+        """ Adds a command from the web server, merging it into any command not yet applied. """
+        with self._condition:
+            self.commands_received += 1
+            pending = self._pending
+            if pending is None:
+                self._pending = ManualCommand(yaw, pitch, fire)
+            else:
+                pending.yaw += yaw
+                pending.pitch += pitch
+                pending.fire = pending.fire or fire
+                # Keep the first arrival time, the older deltas have been waiting since then
+                pending.count += 1
+                self.commands_coalesced += 1
+            self._condition.notify()
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def take(self, timeout=None):
+        """ Waits up to timeout seconds for a command and returns it, or None. """
+        with self._condition:
+            if self._pending is None:
+                self._condition.wait(timeout)
+            command = self._pending
+            self._pending = None
+        if command is not None:
+            command.yaw = max(-self.MAX_STEP, min(self.MAX_STEP, command.yaw))
+            command.pitch = max(-self.MAX_STEP, min(self.MAX_STEP, command.pitch))
+        return command
+
+    def discard(self):
+        """ Drops any command not yet applied, e.g. one that arrived while the turret wasn't in manual. """
+        with self._condition:
+            self._pending = None
+
+    def applied(self, command):
+        """ Records that a command's servo writes are done. """
+        latency = time.perf_counter() - command.received_at
+        self.ticks += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        if self.average_latency is None:
+            self.average_latency = latency
+        else:
+            self.average_latency += 0.05 * (latency - self.average_latency)
+
+    def stats(self):
+        """ Returns latency (in milliseconds) and command counts for the web page. """
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+        return {
+            'last_latency_ms': ms(self.last_latency),
+            'average_latency_ms': ms(self.average_latency),
+            'max_latency_ms': ms(self.max_latency),
+            'commands_received': self.commands_received,
+            'commands_coalesced': self.commands_coalesced,
+            'ticks': self.ticks,
+        }
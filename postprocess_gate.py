@@ -0,0 +1,185 @@
+import threading
+import time
+
+import numpy as np
+
+"""
+Skips HigherHRNet post-processing on frames that can't contain a target.
+With network_postprocess the IMX500 already outputs the top keypoint peaks (val_k, one value per
+person slot and joint).  A joint only becomes part of a person if its peak is above the detection
+threshold, and a person's score is the mean over all 17 joints, so two cheap checks on val_k are exact:
+  - no peak above the detection threshold means nobody is in the frame
+  - sum of the best peak per joint / 17 below the target score means nobody could score high enough
+    (or below the detection threshold, if that is lower, so people shown on the stream stay there)
+So while the turret is idle most frames are skipped, and any frame that could hold a target is
+post-processed straight away: a person walking in is seen on the same frame as without the gate.
+There is deliberately no slower idle rate on top of this.  Any frame that gets past the gate could
+be a partly hidden person who really is a target, so skipping it would see them a frame late.
+Results are written into preallocated arrays, detections() hands out a copy for the control loop.
+"""
+
+NUM_JOINTS = 17
+
+class PostprocessGate:
+    def __init__(self, postprocess, img_size, detection_threshold=0.1, target_score=0.1,
+                 max_people=30, enabled=True):
+        """
+        Initializes the PostprocessGate object.
+
+        :param postprocess: postprocess_higherhrnet (or anything with the same signature)
+        :param img_size: (height, width) the keypoints are scaled to
+        :param detection_threshold: Post-process detection threshold
+        :param target_score: Lowest person score the turret treats as a target
+        :param max_people: Most people post-processing can return
+        :param enabled: False to post-process every frame (for comparison)
+        """
+        self.postprocess = postprocess
+        self.img_size = img_size
+        self.detection_threshold = detection_threshold
+        self.target_score = target_score
+        self.max_people = max_people
+        self.enabled = enabled
+        self._keypoints = np.zeros((max_people, NUM_JOINTS, 3), dtype=np.float32)
+        self._boxes = np.zeros((max_people, 4), dtype=np.float32)
+        self._scores = np.zeros(max_people, dtype=np.float32)
+        self._count = 0
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.postprocessed = 0
+        self.gated = 0
+
+    def score_bound(self, np_outputs):
+        """ Highest score any person in the frame could have, from the raw val_k tensor. """
+        val_k = np_outputs[2][0]
+        above = np.where(val_k > self.detection_threshold, val_k, 0)
+        # Each joint joins at most one person so a score can't beat the best peak per joint
+        return above.max(axis=0).sum() / NUM_JOINTS
+
+    @property
+    def min_score(self):
+        """ Scores a frame must be able to beat to be post-processed. """
+        # People between a lower detection threshold and the target score aren't targets but are
+        # still drawn on the stream, so they mustn't be gated out either
+        return min(self.detection_threshold, self.target_score)
+
+    def has_candidate(self, np_outputs):
+        """ False only if no person in the frame could be drawn or be a target. """
+        return self.score_bound(np_outputs) > self.min_score
+
+    def process(self, np_outputs):
+        """
+        Post-processes one frame's outputs unless the gate says it can't hold a target.
+
+        :param np_outputs: imx500.get_outputs(..., add_batch=True)
+        :return: True if the results changed
+        """
+        self.frames += 1
+        if self.enabled and not self.has_candidate(np_outputs):
+            self.gated += 1
+            return self._found_nothing()
+        return self._run(np_outputs)
+
+    def _run(self, np_outputs):
+        self.postprocessed += 1
+        raw_keypoints, raw_scores, raw_boxes = self.postprocess(outputs=np_outputs,
+                                                                img_size=self.img_size,
+                                                                img_w_pad=(0, 0),
+                                                                img_h_pad=(0, 0),
+                                                                detection_threshold=self.detection_threshold,
+                                                                network_postprocess=True)
+        if raw_scores is None or len(raw_scores) == 0:
+            return self._found_nothing()
+        count = min(len(raw_scores), self.max_people)
+        with self._lock:
+            self._keypoints[:count].reshape(count, NUM_JOINTS * 3)[:] = raw_keypoints[:count]
+            self._boxes[:count] = raw_boxes[:count]
+            self._scores[:count] = raw_scores[:count]
+            self._count = count
+        return True
+
+    def _found_nothing(self):
+        if self._count == 0:
+            return False
+        with self._lock:
+            self._count = 0
+        return True
+
+    def results(self):
+        """ Views of the latest results (keypoints, boxes, scores) for use on the camera thread. """
+        count = self._count
+        if count == 0:
+            return None, None, None
+        return self._keypoints[:count], self._boxes[:count], self._scores[:count]
+
+    def detections(self):
+        """ A copy of the latest results (keypoints, boxes, scores) that is safe to keep on another thread. """
+        with self._lock:
+            count = self._count
+            if count == 0:
+                return None, None, None
+            return self._keypoints[:count].copy(), self._boxes[:count].copy(), self._scores[:count].copy()
+
+
+def simulate_frames(idle_frames=200, person_frames=50, person_joints=NUM_JOINTS, max_people=30, seed=0):
+    """
+    Builds synthetic IMX500 outputs: idle_frames of sensor noise (a few weak stray peaks, and now and
+    then strong peaks that don't group into a person) followed by person_frames with one person in
+    the middle of the frame.  Only person_joints of the person's joints are visible, a partly hidden
+    person can still score above the target score with a bound well under a fully visible one.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(idle_frames + person_frames):
+        tag_k = rng.normal(0, 3, (1, max_people, NUM_JOINTS)).astype(np.float32)
+        ind_k = rng.integers(0, 144 * 192, (1, max_people, NUM_JOINTS)).astype(np.float32)
+        val_k = np.zeros((1, max_people, NUM_JOINTS), dtype=np.float32)
+        # Stray peaks, mostly under the threshold with the odd one over it
+        strays = rng.integers(0, 6)
+        val_k[0, rng.integers(0, max_people, strays), rng.integers(0, NUM_JOINTS, strays)] = \
+            rng.uniform(0.02, 0.3, strays)
+        if rng.random() < 0.3:
+            # Ghost: strong peaks on different joints with tags far apart, passes the gate but isn't a person
+            joints = rng.choice(NUM_JOINTS, 4, replace=False)
+            val_k[0, np.arange(1, 5), joints] = 0.6
+            tag_k[0, np.arange(1, 5), joints] = np.arange(4) * 20 + 50
+        if i >= idle_frames:
+            joints = np.arange(person_joints)
+            val_k[0, 0, :] = 0
+            val_k[0, 0, joints] = rng.uniform(0.5, 0.9, person_joints) if person_joints == NUM_JOINTS else 0.6
+            tag_k[0, 0, :] = 0.5
+            ind_k[0, 0, :] = (72 + rng.integers(-20, 20, NUM_JOINTS)) * 192 + 96 + rng.integers(-10, 10, NUM_JOINTS)
+        frames.append([tag_k, ind_k, val_k])
+    return frames
+
+
+def simulate(postprocess, idle_frames=200, person_frames=50):
+    """
+    Runs the same synthetic frames through the stage with and without gating and prints the CPU
+    time per idle frame and how many frames it took to see the person, for a fully visible person
+    and for one with only 5 joints showing.
+    """
+    for label, person_joints in (("full person", NUM_JOINTS), ("weak person, 5 joints", 5)):
+        frames = simulate_frames(idle_frames, person_frames, person_joints)
+        for enabled in (False, True):
+            stage = PostprocessGate(postprocess, (480, 640), enabled=enabled)
+            idle_cpu = 0.0
+            detected_at = None
+            for i, outputs in enumerate(frames):
+                start = time.process_time()
+                stage.process(outputs)
+                if i < idle_frames:
+                    idle_cpu += time.process_time() - start
+                elif detected_at is None and stage.results()[2] is not None and \
+                        np.any(stage.results()[2] > stage.target_score):
+                    detected_at = i - idle_frames
+            print(f"{label}, {'gated' if enabled else 'ungated'}: "
+                  f"{idle_cpu / idle_frames * 1000:.3f}ms CPU per idle frame, "
+                  f"person seen {detected_at} frames after appearing, "
+                  f"{stage.postprocessed} post-processed, {stage.gated} gated")
+
+
+# Simulator, compares idle CPU and time to detection with and without gating
+if __name__ == "__main__":
+    from picamera2.devices.imx500.postprocess_highernet import postprocess_higherhrnet
+
+    simulate(postprocess_higherhrnet)
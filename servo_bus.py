@@ -0,0 +1,82 @@
+import threading
+
+"""
+Shares one PCA9685 between any number of HATServos.
+In batched mode servo moves are only recorded and flush() writes every channel that changed since
+the last flush, grouping neighbouring channels into single I2C block writes.  A control loop
+calls flush() once per tick so each tick costs one transaction per run of changed channels no
+matter how many turrets share the chip.  Unbatched, every move is written right away.
+"""
+
+class ServoBus:
+    def __init__(self, pwm, batched=False, period_us=20000):
+        """
+        Initializes the ServoBus object.
+
+        :param pwm: PCA9685 object, its frequency must already be set
+        :param batched: Hold writes until flush() (default: write immediately)
+        :param period_us: PWM period in microseconds (default: 20000 for 50Hz)
+        """
+        self.pwm = pwm
+        self.batched = batched
+        self.period_us = period_us
+        self.transactions = 0
+        self._pending = {}
+        self._written = {}
+        self._lock = threading.Lock()
+
+    def set_pulse(self, channel, pulse):
+        """ Sets the pulse width (microseconds) of a channel. """
+        off = int(pulse * 4096 / self.period_us)
+        with self._lock:
+            if self._written.get(channel) == off:
+                # Already on the wire, drop anything queued since
+                self._pending.pop(channel, None)
+                return
+            self._pending[channel] = off
+            if not self.batched:
+                self._flush()
+
+    def disable(self, channel):
+        """ Turns a channel's output off right away. """
+        with self._lock:
+            self._pending.pop(channel, None)
+            self.pwm.setPWM(channel, 0, 0)
+            self._written[channel] = 0
+            self.transactions += 1
+
+    def flush(self):
+        """ Writes all channels that changed since the last flush. """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        channels = sorted(self._pending)
+        run = [channels[0]]
+        for channel in channels[1:]:
+            if channel == run[-1] + 1 and len(run) < self.pwm.MAX_BLOCK_CHANNELS:
+                run.append(channel)
+            else:
+                self._write_run(run)
+                run = [channel]
+        self._write_run(run)
+        self._written.update(self._pending)
+        self._pending.clear()
+
+    def _write_run(self, run):
+        self.pwm.setPWMs(run[0], [self._pending[channel] for channel in run])
+        self.transactions += 1
+
+
+_buses = {}
+
+def get_bus(address=0x40):
+    """ Returns the shared ServoBus for the PCA9685 at address, setting it up on first use. """
+    if address not in _buses:
+        import PCA9685
+        pwm = PCA9685.PCA9685(address, debug=False)
+        pwm.setPWMFreq(50)  # Set frequency to 50Hz for servos
+        _buses[address] = ServoBus(pwm)
+    return _buses[address]
@@ -1,10 +1,139 @@
 document.addEventListener('DOMContentLoaded', (event) => {
     let isArmed = false;
+    let turret = null;
     const armDisarmButton = document.getElementById('armDisarmButton');
+    const turretSelect = document.getElementById('turretSelect');
+    const stream = document.getElementById('stream');
+
+    // Until /turrets answers the server picks its first turret, which is also the one selected then
+    function withTurret(url) {
+        if (turret === null) {
+            return url;
+        }
+        return `${url}${url.includes('?') ? '&' : '?'}turret=${encodeURIComponent(turret)}`;
+    }
 
     armDisarmButton.addEventListener('click', () => {
         isArmed = !isArmed;
         armDisarmButton.textContent = isArmed ? 'Disarm' : 'Arm';
-        fetch(`/set_armed?armed=${isArmed}`);
+        fetch(withTurret(`/set_armed?armed=${isArmed}`));
+    });
+
+    // Manual control: aim deltas are sent over a WebSocket at up to 60Hz
+    const MAX_DEGREES_PER_SEND = 3;
+    let isManual = false;
+    let socket = null;
+    let stick = { x: 0, y: 0 };
+    let fireRequested = false;
+    let gamepadFirePressed = false;
+    const modeButton = document.getElementById('modeButton');
+    const manualControls = document.getElementById('manualControls');
+    const joystick = document.getElementById('joystick');
+    const fireButton = document.getElementById('fireButton');
+    const latency = document.getElementById('latency');
+
+    function connect() {
+        const ws = new WebSocket(`ws://${location.host}${withTurret('/manual')}`);
+        ws.onmessage = (message) => {
+            const stats = JSON.parse(message.data);
+            latency.textContent = `latency ${stats.last_latency_ms} ms (avg ${stats.average_latency_ms} ms)`;
+        };
+        ws.onclose = () => {
+            // Ignore sockets we replaced on purpose
+            if (socket === ws) {
+                socket = null;
+                if (isManual) {
+                    setTimeout(() => { if (socket === null && isManual) connect(); }, 1000);
+                }
+            }
+        };
+        socket = ws;
+    }
+
+    function showMode() {
+        modeButton.textContent = isManual ? 'Auto' : 'Manual';
+        manualControls.style.display = isManual ? 'block' : 'none';
+        if (socket !== null) {
+            const old = socket;
+            socket = null;
+            old.close();
+        }
+        if (isManual) {
+            connect();
+        }
+    }
+
+    modeButton.addEventListener('click', () => {
+        isManual = !isManual;
+        fetch(withTurret(`/set_mode?mode=${isManual ? 'manual' : 'auto'}`));
+        showMode();
+    });
+
+    // Each turret has its own stream and controls
+    function selectTurret(info) {
+        turret = info.name;
+        stream.src = withTurret('stream.mjpg');
+        isArmed = info.armed;
+        armDisarmButton.textContent = isArmed ? 'Disarm' : 'Arm';
+        isManual = info.mode === 'manual';
+        showMode();
+    }
+
+    fetch('/turrets').then((response) => response.json()).then((turrets) => {
+        turrets.forEach((info) => turretSelect.add(new Option(info.name, info.name)));
+        turretSelect.style.display = turrets.length > 1 ? 'inline' : 'none';
+        selectTurret(turrets[0]);
+        turretSelect.addEventListener('change', () => {
+            fetch('/turrets').then((response) => response.json()).then((latest) => {
+                selectTurret(latest.find((info) => info.name === turretSelect.value));
+            });
+        });
     });
-});
\ No newline at end of file
+
+    function updateStick(e) {
+        const rect = joystick.getBoundingClientRect();
+        const x = (e.clientX - rect.left) / rect.width * 2 - 1;
+        const y = (e.clientY - rect.top) / rect.height * 2 - 1;
+        stick = { x: Math.max(-1, Math.min(1, x)), y: Math.max(-1, Math.min(1, y)) };
+    }
+    joystick.addEventListener('pointerdown', (e) => {
+        joystick.setPointerCapture(e.pointerId);
+        updateStick(e);
+    });
+    joystick.addEventListener('pointermove', (e) => {
+        if (joystick.hasPointerCapture(e.pointerId)) {
+            updateStick(e);
+        }
+    });
+    joystick.addEventListener('pointerup', () => { stick = { x: 0, y: 0 }; });
+    fireButton.addEventListener('click', () => { fireRequested = true; });
+
+    setInterval(() => {
+        if (!isManual || socket === null || socket.readyState !== WebSocket.OPEN) {
+            return;
+        }
+        let x = stick.x;
+        let y = stick.y;
+        const gamepad = navigator.getGamepads ? navigator.getGamepads()[0] : null;
+        if (gamepad && Math.abs(x) < 0.01 && Math.abs(y) < 0.01) {
+            x = Math.abs(gamepad.axes[0]) > 0.1 ? gamepad.axes[0] : 0;
+            y = Math.abs(gamepad.axes[1]) > 0.1 ? gamepad.axes[1] : 0;
+        }
+        if (gamepad) {
+            // Only fire once per button press
+            const pressed = gamepad.buttons[0].pressed;
+            fireRequested = fireRequested || (pressed && !gamepadFirePressed);
+            gamepadFirePressed = pressed;
+        }
+        if (Math.abs(x) < 0.01 && Math.abs(y) < 0.01 && !fireRequested) {
+            return;
+        }
+        // Screen y grows downward, positive pitch aims up
+        socket.send(JSON.stringify({
+            yaw: x * MAX_DEGREES_PER_SEND,
+            pitch: -y * MAX_DEGREES_PER_SEND,
+            fire: fireRequested,
+        }));
+        fireRequested = false;
+    }, 1000 / 60);
+});
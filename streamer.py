@@ -5,17 +5,30 @@
 # Note: needs simplejpeg to be installed (pip3 install simplejpeg).
 
 import io
+import json
 import logging
+import math
+import socket
 import socketserver
+import gzip
+import hashlib
+import mimetypes
+import time
+from email.utils import formatdate, parsedate_to_datetime
 from http import server
-from threading import Condition
+from threading import Condition, Lock
 from http.server import SimpleHTTPRequestHandler
 import os
 from urllib.parse import urlparse, parse_qs  # Add this import
 
-from picamera2 import Picamera2
-from picamera2.encoders import JpegEncoder
-from picamera2.outputs import FileOutput
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import websocket_util
+from turret_config import ConfigError
+from event_log import LogLevel
 
 PAGE = """\
 <html>
@@ -24,16 +37,30 @@ PAGE = """\
 </head>
 <body>
 <h1>Turret View</h1>
-<img src="stream.mjpg" />
+<select id="turretSelect"></select>
+<img id="stream" src="stream.mjpg" />
 <button id="armDisarmButton">Arm</button>
+<button id="modeButton">Manual</button>
+<div id="manualControls" style="display: none">
+<div id="joystick" style="width: 200px; height: 200px; border: 1px solid #888; border-radius: 50%; touch-action: none"></div>
+<button id="fireButton">Fire</button>
+<span id="latency"></span>
+</div>
 <script src="script.js"></script>
 </body>
 </html>
 """
 
-# Turret State
-armed_state = False
-mode = 'search'
+STATIC_DIR = 'static'
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# Server wide settings
+# Number of open /stream.mjpg connections, read by the governor
+stream_viewers = 0
+_viewers_lock = Lock()
+
+def viewer_count():
+    return stream_viewers
 
 class StreamingOutput(io.BufferedIOBase):
     def __init__(self):
@@ -46,28 +73,237 @@ class StreamingOutput(io.BufferedIOBase):
             self.condition.notify_all()
 
 
+class TurretChannel:
+    """
+    The web facing side of one turret: its video stream, arm switch, mode and manual commands.
+    """
+    def __init__(self, name, output, manual_control=None):
+        self.name = name
+        self.output = output
+        self.manual_control = manual_control
+        self.armed = False
+        self.mode = 'auto'
+
+    def to_dict(self):
+        return {'name': self.name, 'armed': self.armed, 'mode': self.mode}
+
+
+class StaticAsset:
+    """
+    A static file held in memory along with its precompressed variants and validators.
+    """
+    def __init__(self, content, content_type, mtime):
+        self.content_type = content_type
+        self.last_modified = formatdate(int(mtime), usegmt=True)
+        self.mtime = int(mtime)
+        digest = hashlib.sha1(content).hexdigest()
+        # Each content-coding is a different representation so it gets its own strong ETag
+        self.variants = {'identity': (content, f'"{digest}"')}
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+            if len(compressed) < len(content):
+                self.variants['gzip'] = (compressed, f'"{digest}-gz"')
+            if brotli is not None:
+                compressed = brotli.compress(content, quality=11)
+                if len(compressed) < len(content):
+                    self.variants['br'] = (compressed, f'"{digest}-br"')
+
+    def select(self, accept_encoding):
+        """ Returns (encoding, body, etag) for the best variant the client accepts. """
+        accepted = _parse_accept_encoding(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                return (encoding,) + self.variants[encoding]
+        return ('identity',) + self.variants['identity']
+
+
+def _parse_accept_encoding(header):
+    """ Returns the set of codings from an Accept-Encoding header that don't have q=0. """
+    accepted = set()
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+        if coding and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.lower())
+    return accepted
+
+
+class StaticCache:
+    """
+    Loads the static directory and the index page into memory once so page loads cost no disk I/O.
+    Call load() again (or start_watching()) to pick up changes without restarting the server.
+    """
+    def __init__(self, directory=STATIC_DIR, page=PAGE):
+        self.directory = directory
+        self.page = page.encode('utf-8')
+        self.page_mtime = time.time()
+        self.assets = {}
+        self.watcher = None
+        self.load()
+
+    def load(self):
+        """ Reads every file in the directory and swaps the new set in all at once. """
+        assets = {'/index.html': StaticAsset(self.page, 'text/html; charset=utf-8', self.page_mtime)}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                url_path = '/' + os.path.relpath(full_path, self.directory).replace(os.sep, '/')
+                content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                if content_type.startswith('text/') or content_type == 'application/javascript':
+                    content_type += '; charset=utf-8'
+                with open(full_path, 'rb') as f:
+                    content = f.read()
+                assets[url_path] = StaticAsset(content, content_type, os.path.getmtime(full_path))
+        self.assets = assets
+        print(f"Loaded {len(assets)} static assets")
+
+    def get(self, path):
+        return self.assets.get(path)
+
+    def start_watching(self):
+        """ Reloads the cache whenever something in the static directory changes. """
+        from file_watcher import FileWatcher
+        self.watcher = FileWatcher([self.directory], self.load).start()
+
+    def stop_watching(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
+
 class StreamingHandler(SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
-        self.output = kwargs.pop('output', None)
-        super().__init__(*args, directory='static', **kwargs)
+        # Requests pick a turret with ?turret=<name>, the first one is the default
+        self.channels = {channel.name: channel for channel in kwargs.pop('channels', [])}
+        self.static_cache = kwargs.pop('static_cache', None)
+        self.config_manager = kwargs.pop('config_manager', None)
+        self.event_log = kwargs.pop('event_log', None)
+        super().__init__(*args, directory=STATIC_DIR, **kwargs)
+
+    def send_static(self, asset, head_only=False):
+        """ Sends a cached asset, answering with 304 if the client's copy is still current. """
+        encoding, body, etag = asset.select(self.headers.get('Accept-Encoding'))
+        if self.is_not_modified(asset, etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', asset.last_modified)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', asset.content_type)
+        self.send_header('Content-Length', len(body))
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', asset.last_modified)
+        # Always revalidate so reloaded assets show up right away, a 304 is cheap
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def is_not_modified(self, asset, etag):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-None-Match wins over If-Modified-Since when both are present
+            # Weak comparison, a W/ prefix doesn't stop a match
+            tags = [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+            return '*' in tags or etag in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                return asset.mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def do_HEAD(self):
+        asset = self.static_cache.get(urlparse(self.path).path) if self.static_cache else None
+        if asset is not None:
+            self.send_static(asset, head_only=True)
+        elif self.static_cache is not None:
+            # Same answer as GET, never fall back to reading the disk
+            self.send_error(404, "File not found")
+        else:
+            super().do_HEAD()
+
+    def handle_manual_socket(self, channel):
+        """ Runs the manual aim WebSocket until the browser goes away. """
+        # Browsers only accept the upgrade on an HTTP/1.1 status line
+        self.protocol_version = 'HTTP/1.1'
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', websocket_util.accept_key(self.headers['Sec-WebSocket-Key']))
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        # Small frames at up to 60Hz, don't let Nagle hold them back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        last_stats = 0
+        try:
+            while True:
+                opcode, payload = websocket_util.read_frame(self.rfile)
+                if opcode == websocket_util.OPCODE_CLOSE:
+                    websocket_util.write_frame(self.wfile, payload[:2], websocket_util.OPCODE_CLOSE)
+                    break
+                elif opcode == websocket_util.OPCODE_PING:
+                    websocket_util.write_frame(self.wfile, payload, websocket_util.OPCODE_PONG)
+                elif opcode == websocket_util.OPCODE_TEXT:
+                    try:
+                        yaw, pitch, fire = parse_manual_command(payload)
+                    except (ValueError, TypeError) as e:
+                        self.close_socket(websocket_util.CLOSE_INVALID_DATA, f"Bad command: {e}")
+                        break
+                    # Another tab may have switched the turret back to auto
+                    if channel.mode == 'manual':
+                        channel.manual_control.submit(yaw, pitch, fire)
+                    if time.monotonic() - last_stats > 0.5:
+                        last_stats = time.monotonic()
+                        websocket_util.write_frame(self.wfile, json.dumps(channel.manual_control.stats()))
+        except websocket_util.FrameTooLarge as e:
+            self.close_socket(websocket_util.CLOSE_TOO_BIG, str(e))
+        except (ConnectionError, ValueError, OSError) as e:
+            logging.warning('Closed manual control socket %s: %s', self.client_address, str(e))
+
+    def close_socket(self, code, reason):
+        logging.warning('Closing manual control socket %s: %s', self.client_address, reason)
+        try:
+            websocket_util.write_frame(self.wfile, websocket_util.close_payload(code, reason),
+                                       websocket_util.OPCODE_CLOSE)
+        except OSError:
+            pass
+
+    def send_json(self, value):
+        content = json.dumps(value).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', len(content))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(content)
 
     def do_GET(self):
-        global armed_state
+        global stream_viewers
         parsed_url = urlparse(self.path)  # Parse the URL
         path = parsed_url.path  # Extract the path
         query_params = parse_qs(parsed_url.query)  # Extract query parameters as a dictionary
+        turret_name = query_params.get('turret', [None])[0]
+        if turret_name is None:
+            channel = next(iter(self.channels.values()), None)
+        else:
+            channel = self.channels.get(turret_name)
+        if channel is None and path in ('/stream.mjpg', '/set_armed', '/set_mode', '/manual', '/manual_stats'):
+            self.send_error(404, "Unknown turret")
+            return
 
         if path == '/':
             self.send_response(301)
             self.send_header('Location', '/index.html')
             self.end_headers()
-        elif path == '/index.html':
-            content = PAGE.encode('utf-8')
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/html')
-            self.send_header('Content-Length', len(content))
-            self.end_headers()
-            self.wfile.write(content)
         elif path == '/stream.mjpg':
             self.send_response(200)
             self.send_header('Age', 0)
@@ -75,11 +311,13 @@ class StreamingHandler(SimpleHTTPRequestHandler):
             self.send_header('Pragma', 'no-cache')
             self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
             self.end_headers()
+            with _viewers_lock:
+                stream_viewers += 1
             try:
                 while True:
-                    with self.output.condition:
-                        self.output.condition.wait()
-                        frame = self.output.frame
+                    with channel.output.condition:
+                        channel.output.condition.wait()
+                        frame = channel.output.frame
                     self.wfile.write(b'--FRAME\r\n')
                     self.send_header('Content-Type', 'image/jpeg')
                     self.send_header('Content-Length', len(frame))
@@ -90,26 +328,89 @@ class StreamingHandler(SimpleHTTPRequestHandler):
                 logging.warning(
                     'Removed streaming client %s: %s',
                     self.client_address, str(e))
+            finally:
+                with _viewers_lock:
+                    stream_viewers -= 1
         elif path == '/set_armed':
-            armed_state = query_params.get('armed', ['false'])[0].lower() == 'true'
+            channel.armed = query_params.get('armed', ['false'])[0].lower() == 'true'
             self.send_response(200)
             self.end_headers()
+        elif path == '/set_mode':
+            new_mode = query_params.get('mode', [''])[0].lower()
+            if new_mode in ('auto', 'manual'):
+                channel.mode = new_mode
+                self.send_response(200)
+                self.end_headers()
+            else:
+                self.send_error(400, "mode must be auto or manual")
+        elif path == '/manual' and channel.manual_control is not None:
+            if websocket_util.is_upgrade_request(self.headers):
+                self.handle_manual_socket(channel)
+            else:
+                self.send_error(400, "Expected a WebSocket upgrade")
+        elif path == '/manual_stats' and channel.manual_control is not None:
+            self.send_json(channel.manual_control.stats())
+        elif path == '/turrets':
+            self.send_json([c.to_dict() for c in self.channels.values()])
+        elif path == '/reload_config' and self.config_manager is not None:
+            try:
+                config = self.config_manager.reload()
+            except ConfigError as e:
+                self.send_error(400, str(e))
+                return
+            self.send_json(config.to_dict())
+        elif path == '/set_log_level' and self.event_log is not None:
+            level = query_params.get('level', [''])[0].upper()
+            if level in LogLevel.__members__:
+                self.event_log.set_level(LogLevel[level])
+                self.send_response(200)
+                self.end_headers()
+            else:
+                self.send_error(400, "level must be one of " + ", ".join(l.name.lower() for l in LogLevel))
+        elif self.static_cache is not None:
+            asset = self.static_cache.get(path)
+            if asset is not None:
+                self.send_static(asset)
+            else:
+                self.send_error(404, "File not found")
         else:
             super().do_GET()
 
 
+def parse_manual_command(payload):
+    """ Returns (yaw, pitch, fire) from a manual control message, raising ValueError or TypeError if it's bad. """
+    command = json.loads(payload)
+    if not isinstance(command, dict):
+        raise TypeError("command must be a JSON object")
+    yaw = float(command.get('yaw', 0))
+    pitch = float(command.get('pitch', 0))
+    if not (math.isfinite(yaw) and math.isfinite(pitch)):
+        raise ValueError("yaw and pitch must be finite")
+    return yaw, pitch, bool(command.get('fire', False))
+
+
 class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
     allow_reuse_address = True
     daemon_threads = True
     
 server = None
-def start_streaming_server(output, address=('', 8000)):
-    global server
-    server = StreamingServer(address, lambda *args, **kwargs: StreamingHandler(*args, output=output, **kwargs))
+static_cache = None
+def start_streaming_server(channels, address=('', 8000), watch_static=False, config_manager=None,
+                           event_log=None):
+    global server, static_cache
+    static_cache = StaticCache()
+    if watch_static:
+        static_cache.start_watching()
+    server = StreamingServer(address, lambda *args, **kwargs: StreamingHandler(*args, channels=channels,
+                                                                                static_cache=static_cache,
+                                                                                config_manager=config_manager,
+                                                                                event_log=event_log, **kwargs))
     print(f"Starting server at {server.server_address}")
     server.serve_forever()
 def stop_streaming_server():
     global server
+    if static_cache:
+        static_cache.stop_watching()
     if server:
         server.shutdown()
         server.server_close()
@@ -119,12 +420,17 @@ def stop_streaming_server():
         print("No server to stop.")
         
 if __name__ == "__main__":
+    # Only the standalone demo needs the camera, the server itself doesn't
+    from picamera2 import Picamera2
+    from picamera2.encoders import JpegEncoder
+    from picamera2.outputs import FileOutput
+
     with Picamera2() as picam2:
         picam2.configure(picam2.create_video_configuration())
         output = StreamingOutput()
         picam2.start_recording(JpegEncoder(), FileOutput(output))
 
         try:
-            start_streaming_server(output)
+            start_streaming_server([TurretChannel('camera', output)])
         finally:
             picam2.stop_recording()
\ No newline at end of file
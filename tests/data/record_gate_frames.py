@@ -0,0 +1,74 @@
+"""
+Records the frames used by tests/test_postprocess_gate.py.
+Builds IMX500-style outputs where people's joints are spread over the top-k slots (each joint's
+peaks sorted by value, the way the network outputs them), so grouping by tag really has to happen,
+runs them through picamera2's postprocess_higherhrnet and saves the inputs with the scores it gave.
+Run on a machine with picamera2 installed:  python3 tests/data/record_gate_frames.py
+"""
+import os
+
+import numpy as np
+from picamera2.devices.imx500.postprocess_highernet import postprocess_higherhrnet
+
+NUM_JOINTS = 17
+MAX_PEOPLE = 30
+THRESHOLD = 0.1
+
+
+def frame(rng, people):
+    """ people: list of (tag, {joint: value}), slots per joint are filled in descending value order. """
+    tag_k = np.zeros((1, MAX_PEOPLE, NUM_JOINTS), dtype=np.float32)
+    ind_k = np.zeros((1, MAX_PEOPLE, NUM_JOINTS), dtype=np.float32)
+    val_k = np.zeros((1, MAX_PEOPLE, NUM_JOINTS), dtype=np.float32)
+    for joint in range(NUM_JOINTS):
+        peaks = [(joints[joint], tag + rng.normal(0, 0.05), rng.integers(0, 144 * 192))
+                 for tag, joints in people if joint in joints]
+        # A few weak peaks that belong to nobody
+        peaks += [(rng.uniform(0.01, 0.15), rng.normal(0, 5), rng.integers(0, 144 * 192))
+                  for _ in range(rng.integers(0, 3))]
+        peaks.sort(key=lambda p: -p[0])
+        for slot, (value, tag, ind) in enumerate(peaks[:MAX_PEOPLE]):
+            val_k[0, slot, joint] = value
+            tag_k[0, slot, joint] = tag
+            ind_k[0, slot, joint] = ind
+    return [tag_k, ind_k, val_k]
+
+
+def person(rng, tag, joints, low, high):
+    chosen = rng.choice(NUM_JOINTS, joints, replace=False)
+    return tag, {int(j): float(rng.uniform(low, high)) for j in chosen}
+
+
+def make_frames(seed=1):
+    rng = np.random.default_rng(seed)
+    scenes = [
+        [],
+        [person(rng, 0, 17, 0.5, 0.9)],
+        [person(rng, 0, 5, 0.55, 0.65)],
+        [person(rng, 0, 2, 0.5, 0.7)],
+        # Two people whose joints beat each other in different slots
+        [person(rng, 0, 17, 0.3, 0.9), person(rng, 10, 17, 0.3, 0.9)],
+        [person(rng, 0, 9, 0.2, 0.4), person(rng, 5, 9, 0.2, 0.4), person(rng, 10, 9, 0.2, 0.4)],
+        # Strong peaks with tags too far apart to be one person
+        [person(rng, tag, 1, 0.8, 0.9) for tag in (0, 20, 40, 60, 80)],
+        [person(rng, 0, 3, 0.12, 0.2)],
+    ]
+    frames = []
+    for _ in range(4):
+        for people in scenes:
+            frames.append(frame(rng, people))
+    return frames
+
+
+if __name__ == "__main__":
+    frames = make_frames()
+    scores = np.full((len(frames), MAX_PEOPLE), np.nan, dtype=np.float32)
+    for i, outputs in enumerate(frames):
+        _, frame_scores, _ = postprocess_higherhrnet(outputs=outputs, img_size=(480, 640), img_w_pad=(0, 0),
+                                                     img_h_pad=(0, 0), detection_threshold=THRESHOLD,
+                                                     network_postprocess=True)
+        scores[i, :len(frame_scores)] = frame_scores
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gate_frames.npz")
+    np.savez_compressed(path, tag_k=np.stack([f[0] for f in frames]), ind_k=np.stack([f[1] for f in frames]),
+                        val_k=np.stack([f[2] for f in frames]), scores=scores, threshold=THRESHOLD)
+    print(f"Saved {len(frames)} frames to {path}")
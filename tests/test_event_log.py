@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pytest
+
+from event_log import EVENT_DTYPE, EventLog, EventType, LogLevel, read_events
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / "events.bin")
+    log = EventLog(path, level=LogLevel.DEBUG)
+    log.record(LogLevel.INFO, EventType.FIRE, 4, 1, (320, 240), yaw_angle=12.5, turret=1)
+    log.flush()
+    log._file.close()
+    events = read_events(path)
+    assert len(events) == 1
+    assert events[0]['turret'] == 1 and events[0]['event'] == EventType.FIRE and events[0]['aim_x'] == 320
+
+
+def test_old_format_file_is_rotated_out(tmp_path):
+    path = str(tmp_path / "events.bin")
+    # A file from before the header, with records one byte shorter (no turret field)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * (EVENT_DTYPE.itemsize - 1) * 10)
+    with pytest.raises(ValueError):
+        read_events(path)
+    log = EventLog(path)
+    log.record(LogLevel.INFO, EventType.TRANSITION, 1, 2)
+    log.flush()
+    log._file.close()
+    assert os.path.getsize(path + ".1") == (EVENT_DTYPE.itemsize - 1) * 10
+    assert len(read_events(path)) == 1
+
+
+def test_appends_to_a_current_file(tmp_path):
+    path = str(tmp_path / "events.bin")
+    for _ in range(2):
+        log = EventLog(path)
+        log.record(LogLevel.INFO, EventType.TRANSITION, 1, 2)
+        log.flush()
+        log._file.close()
+    assert len(read_events(path)) == 2 and not os.path.exists(path + ".1")
+
+
+def test_rotation_starts_a_readable_file(tmp_path):
+    path = str(tmp_path / "events.bin")
+    log = EventLog(path, level=LogLevel.DEBUG, max_bytes=EVENT_DTYPE.itemsize * 20)
+    for batch in range(3):
+        for _ in range(8):
+            log.record(LogLevel.INFO, EventType.AIM)
+        log.flush()
+    log._file.close()
+    assert len(read_events(path)) + len(read_events(path + ".1")) == 24
+    assert np.all(read_events(path)['event'] == EventType.AIM)
@@ -0,0 +1,83 @@
+import os
+
+from governor import Governor
+
+
+def write(root, path, value):
+    full = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    with open(full, "w") as f:
+        f.write(value)
+
+
+def make_tree(root, temp_c, load=0.0):
+    write(root, "sys/class/thermal/thermal_zone0/temp", f"{int(temp_c * 1000)}\n")
+    write(root, "sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq", "1500000\n")
+    write(root, "sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_max_freq", "1500000\n")
+    write(root, "sys/devices/system/cpu/online", "0-3\n")
+    write(root, "proc/loadavg", f"{load:.2f} 0.00 0.00 1/100 1\n")
+
+
+def test_steps_down_in_order_and_recovers(tmp_path):
+    root = str(tmp_path)
+    changes = []
+    governor = Governor(sysfs_root=root, on_change=lambda level: changes.append(level.name))
+
+    make_tree(root, 80)
+    for _ in range(20):
+        governor.update()
+    assert changes == ["stream_reduced", "stream_minimal", "overlay_reduced", "inference_reduced"]
+
+    changes.clear()
+    make_tree(root, 50)
+    for _ in range(40):
+        governor.update()
+    assert changes == ["overlay_reduced", "stream_minimal", "stream_reduced", "normal"]
+
+
+def test_holds_between_thresholds(tmp_path):
+    root = str(tmp_path)
+    governor = Governor(sysfs_root=root)
+    make_tree(root, 80)
+    for _ in range(2):
+        governor.update()
+    assert governor.level.name == "stream_reduced"
+    make_tree(root, 70)
+    for _ in range(20):
+        governor.update()
+    assert governor.level.name == "stream_reduced"
+
+
+def test_viewers_keep_the_stream_reduced(tmp_path):
+    root = str(tmp_path)
+    viewers = [5]
+    governor = Governor(sysfs_root=root, viewer_count=lambda: viewers[0], max_viewers=3)
+    make_tree(root, 50)
+    governor.update()
+    assert governor.level.name == "stream_reduced"
+    for _ in range(20):
+        governor.update()
+    assert governor.level.name == "stream_reduced"
+
+    viewers[0] = 1
+    for _ in range(5):
+        governor.update()
+    assert governor.level.name == "normal"
+
+
+def test_load_is_per_cpu_in_the_tree(tmp_path):
+    root = str(tmp_path)
+    governor = Governor(sysfs_root=root)
+    make_tree(root, 50, load=3.6)
+    assert governor.cpu_count() == 4
+    assert abs(governor.sample()['load'] - 0.9) < 1e-9
+    for _ in range(2):
+        governor.update()
+    assert governor.level.name == "stream_reduced"
+
+
+def test_cpu_list_with_gaps(tmp_path):
+    root = str(tmp_path)
+    write(root, "sys/devices/system/cpu/online", "0,2-3\n")
+    assert Governor(sysfs_root=root).cpu_count() == 3
+    assert Governor(sysfs_root=root, cpus=8).cpu_count() == 8
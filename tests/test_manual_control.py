@@ -0,0 +1,106 @@
+import io
+import struct
+import threading
+
+import pytest
+
+import websocket_util
+from manual_control import ManualControl
+from streamer import parse_manual_command
+
+
+def client_frame(payload, opcode=websocket_util.OPCODE_TEXT, mask=b'\x12\x34\x56\x78'):
+    """ Builds a frame the way a browser does, always masked. """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+    masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return io.BytesIO(header + mask + masked)
+
+
+def test_read_masked_frames():
+    for payload in (b'{"yaw": 1}', b'x' * 300):
+        assert websocket_util.read_frame(client_frame(payload)) == (websocket_util.OPCODE_TEXT, payload)
+    assert websocket_util.read_frame(client_frame(b'', websocket_util.OPCODE_PING)) == (websocket_util.OPCODE_PING, b'')
+
+
+def test_frame_size_limit():
+    with pytest.raises(websocket_util.FrameTooLarge):
+        websocket_util.read_frame(client_frame(b'x' * 5000))
+    # The length is checked before the payload is read
+    with pytest.raises(websocket_util.FrameTooLarge):
+        websocket_util.read_frame(io.BytesIO(struct.pack('!BBQ', 0x81, 0x80 | 127, 10 ** 12)))
+
+
+def test_truncated_frame():
+    with pytest.raises(ConnectionError):
+        websocket_util.read_frame(io.BytesIO(client_frame(b'hello').getvalue()[:-2]))
+
+
+def test_write_frame_and_close_payload():
+    out = io.BytesIO()
+    websocket_util.write_frame(out, websocket_util.close_payload(websocket_util.CLOSE_TOO_BIG, 'big'),
+                               websocket_util.OPCODE_CLOSE)
+    assert out.getvalue() == b'\x88\x05' + struct.pack('!H', 1009) + b'big'
+    out = io.BytesIO()
+    websocket_util.write_frame(out, 'y' * 200)
+    assert out.getvalue()[:4] == b'\x81\x7e' + struct.pack('!H', 200)
+
+
+def test_accept_key():
+    # Example from RFC 6455
+    assert websocket_util.accept_key('dGhlIHNhbXBsZSBub25jZQ==') == 's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+
+
+def test_parse_manual_command():
+    assert parse_manual_command(b'{"yaw": 1.5, "pitch": -2, "fire": true}') == (1.5, -2.0, True)
+    assert parse_manual_command(b'{}') == (0.0, 0.0, False)
+    for bad in (b'[1]', b'{"yaw": null}', b'{"yaw": NaN}', b'{"pitch": "up"}', b'not json'):
+        with pytest.raises((ValueError, TypeError)):
+            parse_manual_command(bad)
+
+
+def test_commands_are_merged():
+    control = ManualControl()
+    control.submit(2, 1)
+    control.submit(3, -4, fire=True)
+    control.submit(1, 0)
+    command = control.take(timeout=0)
+    assert (command.yaw, command.pitch, command.fire, command.count) == (6, -3, True, 3)
+    assert control.take(timeout=0) is None
+
+
+def test_merged_command_is_clamped():
+    control = ManualControl()
+    for _ in range(5):
+        control.submit(4, -4)
+    command = control.take(timeout=0)
+    assert (command.yaw, command.pitch) == (ManualControl.MAX_STEP, -ManualControl.MAX_STEP)
+
+
+def test_latency_counts_from_the_oldest_command():
+    control = ManualControl()
+    control.submit(1, 0)
+    first = control._pending.received_at
+    control.submit(1, 0)
+    command = control.take(timeout=0)
+    assert command.received_at == first
+    control.applied(command)
+    assert control.stats()['ticks'] == 1 and control.last_latency >= 0
+
+
+def test_discard():
+    control = ManualControl()
+    control.submit(0, 0, fire=True)
+    control.discard()
+    assert control.take(timeout=0) is None
+
+
+def test_wakeup_is_set():
+    wakeup = threading.Event()
+    ManualControl(wakeup=wakeup).submit(1, 1)
+    assert wakeup.is_set()
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pytest
+
+from postprocess_gate import PostprocessGate, NUM_JOINTS
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gate_frames.npz")
+
+
+class RecordingPostprocess:
+    """ Stands in for postprocess_higherhrnet, only records which frames it was asked to process. """
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, outputs, **kwargs):
+        self.calls += 1
+        return [], [], []
+
+
+def outputs_with(values):
+    val_k = np.zeros((1, 30, NUM_JOINTS), dtype=np.float32)
+    val_k[0, 0, :len(values)] = values
+    return [np.zeros_like(val_k), np.zeros_like(val_k), val_k]
+
+
+def test_empty_frame_is_gated():
+    postprocess = RecordingPostprocess()
+    stage = PostprocessGate(postprocess, (480, 640))
+    stage.process(outputs_with([0.05, 0.09]))
+    assert postprocess.calls == 0 and stage.gated == 1
+
+
+def test_weak_person_is_never_skipped():
+    # 5 joints at 0.6 scores 5 * 0.6 / 17 = 0.176, above the 0.1 target score
+    postprocess = RecordingPostprocess()
+    stage = PostprocessGate(postprocess, (480, 640))
+    for _ in range(50):
+        stage.process(outputs_with([0.05]))
+    for _ in range(5):
+        stage.process(outputs_with([0.6] * 5))
+    assert postprocess.calls == 5
+
+
+def test_lower_detection_threshold_lowers_the_gate():
+    # 2 joints at 0.6 scores 0.07, under the target score but above a 0.05 detection threshold
+    postprocess = RecordingPostprocess()
+    stage = PostprocessGate(postprocess, (480, 640), target_score=0.1)
+    stage.process(outputs_with([0.6] * 2))
+    assert postprocess.calls == 0
+    stage.detection_threshold = 0.05
+    stage.process(outputs_with([0.6] * 2))
+    assert postprocess.calls == 1
+
+
+def recorded_frames():
+    """
+    Frames with people spread over the top-k slots and the scores picamera2's postprocess_higherhrnet
+    gave them, see tests/data/record_gate_frames.py.
+    """
+    data = np.load(DATA)
+    for i in range(len(data['scores'])):
+        scores = data['scores'][i]
+        yield [data['tag_k'][i], data['ind_k'][i], data['val_k'][i]], scores[~np.isnan(scores)]
+
+
+def test_bound_is_never_below_a_grouped_score():
+    stage = PostprocessGate(RecordingPostprocess(), (480, 640), detection_threshold=float(np.load(DATA)['threshold']))
+    checked = 0
+    for outputs, scores in recorded_frames():
+        assert stage.score_bound(outputs) >= scores.max(initial=0) - 1e-6
+        checked += len(scores)
+    assert checked > 0
+
+
+def test_frames_with_a_grouped_target_are_never_gated():
+    postprocess = RecordingPostprocess()
+    stage = PostprocessGate(postprocess, (480, 640), detection_threshold=float(np.load(DATA)['threshold']))
+    targets = 0
+    for outputs, scores in recorded_frames():
+        calls = postprocess.calls
+        stage.process(outputs)
+        if np.any(scores > stage.min_score):
+            targets += 1
+            assert postprocess.calls == calls + 1
+    # The recording has people (two of them sharing slots in some frames) to check and ghosts to gate
+    assert targets > 0 and stage.gated > 0
+
+
+def test_recording_matches_postprocess():
+    module = pytest.importorskip("picamera2.devices.imx500.postprocess_highernet")
+    threshold = float(np.load(DATA)['threshold'])
+    for outputs, scores in recorded_frames():
+        _, live, _ = module.postprocess_higherhrnet(outputs=outputs, img_size=(480, 640), img_w_pad=(0, 0),
+                                                    img_h_pad=(0, 0), detection_threshold=threshold,
+                                                    network_postprocess=True)
+        assert np.allclose(np.array(live, dtype=np.float32), scores)
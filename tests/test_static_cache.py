@@ -0,0 +1,97 @@
+import http.client
+import os
+import threading
+
+import pytest
+
+import streamer
+from streamer import StaticAsset, StaticCache, _parse_accept_encoding
+
+CSS = b"body { color: red; }\n" * 50
+
+
+def test_accept_encoding_drops_q0():
+    assert _parse_accept_encoding("gzip;q=0, br;q=0.0, deflate") == {"deflate"}
+    assert _parse_accept_encoding("GZIP; q=0.5") == {"gzip"}
+    assert _parse_accept_encoding(None) == set()
+
+
+def test_brotli_preferred_over_gzip():
+    asset = StaticAsset(CSS, "text/css", 0)
+    asset.variants['br'] = (b"fake brotli", '"x-br"')
+    assert asset.select("gzip, br")[0] == "br"
+    assert asset.select("gzip, br;q=0")[0] == "gzip"
+    assert asset.select("identity")[0] == "identity"
+
+
+def test_variants_have_their_own_etags():
+    asset = StaticAsset(CSS, "text/css", 0)
+    identity = asset.select(None)
+    gzipped = asset.select("gzip")
+    assert gzipped[0] == "gzip" and identity[2] != gzipped[2]
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "style.css").write_bytes(CSS)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "app.js").write_bytes(b"console.log(1);\n")
+    cache = StaticCache(directory=str(tmp_path))
+    httpd = streamer.StreamingServer(('127.0.0.1', 0), lambda *args, **kwargs: streamer.StreamingHandler(
+        *args, channels=[], static_cache=cache, **kwargs))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def request(port, method, path, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    connection.request(method, path, headers=headers or {})
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+    return response, body
+
+
+def test_get_and_conditional_get(server):
+    response, body = request(server, "GET", "/style.css")
+    assert response.status == 200 and body == CSS
+    etag = response.getheader("ETag")
+    last_modified = response.getheader("Last-Modified")
+
+    response, body = request(server, "GET", "/style.css", {"If-None-Match": etag})
+    assert response.status == 304 and body == b""
+    response, _ = request(server, "GET", "/style.css", {"If-None-Match": "W/" + etag})
+    assert response.status == 304
+    response, _ = request(server, "GET", "/style.css", {"If-Modified-Since": last_modified})
+    assert response.status == 304
+
+
+def test_if_none_match_beats_if_modified_since(server):
+    response, _ = request(server, "GET", "/style.css")
+    headers = {"If-None-Match": '"stale"', "If-Modified-Since": response.getheader("Last-Modified")}
+    response, body = request(server, "GET", "/style.css", headers)
+    assert response.status == 200 and body == CSS
+
+
+def test_gzip_served_when_accepted(server):
+    response, body = request(server, "GET", "/style.css", {"Accept-Encoding": "gzip"})
+    assert response.getheader("Content-Encoding") == "gzip" and len(body) < len(CSS)
+    response, body = request(server, "GET", "/style.css", {"Accept-Encoding": "gzip;q=0"})
+    assert response.getheader("Content-Encoding") is None and body == CSS
+
+
+def test_subdirectories_and_head(server):
+    response, body = request(server, "GET", "/sub/app.js")
+    assert response.status == 200
+    response, body = request(server, "HEAD", "/sub/app.js")
+    assert response.status == 200 and body == b""
+
+
+def test_head_404_matches_get(server, monkeypatch):
+    # static/script.js is on disk but not in this cache, HEAD mustn't go and find it
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert request(server, "GET", "/script.js")[0].status == 404
+    assert request(server, "HEAD", "/script.js")[0].status == 404
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from turret_config import ConfigError, ConfigManager, DEFAULTS, TurretConfig
+
+
+def turret(name="turret", pitch=0, yaw=1, fire=2, **extra):
+    return dict({"name": name, "camera_id": "", "mount_yaw": 0,
+                 "channels": {"pitch": pitch, "yaw": yaw, "fire": fire}}, **extra)
+
+
+def test_defaults():
+    config = TurretConfig()
+    assert config.detection_threshold == DEFAULTS["detection_threshold"]
+    assert config.yaw_pid == (0.1, 0.01, 0.05, 20)
+    assert config.servos["pitch"] == (1000, 2000)
+    assert config.turrets == [turret(servos=config.servos)]
+
+
+def test_partial_values_merge_with_defaults():
+    config = TurretConfig({"lock_time": 3, "yaw_pid": {"kp": 0.5}, "servos": {"fire": {"max_pulse": 2000}}})
+    assert config.lock_time == 3
+    assert config.yaw_pid == (0.5, 0.01, 0.05, 20)
+    assert config.pitch_pid == (0.1, 0.01, 0.05, 20)
+    assert config.servos["fire"] == (500, 2000)
+    # The defaults themselves are never changed
+    assert DEFAULTS["yaw_pid"]["kp"] == 0.1
+
+
+def test_several_turrets():
+    config = TurretConfig({"turrets": [turret("left", 0, 1, 2), turret("right", 3, 4, 5, mount_yaw=-30)]})
+    assert [t["name"] for t in config.turrets] == ["left", "right"]
+    assert config.turrets[1]["mount_yaw"] == -30
+
+
+def test_whole_float_channels_become_ints():
+    config = TurretConfig({"turrets": [turret(pitch=0.0, yaw=1.0, fire=2.0)]})
+    channels = config.turrets[0]["channels"]
+    assert channels == {"pitch": 0, "yaw": 1, "fire": 2}
+    assert all(type(c) is int for c in channels.values())
+
+
+def test_per_turret_servo_overrides():
+    config = TurretConfig({"turrets": [turret("left", 0, 1, 2),
+                                       turret("right", 3, 4, 5, servos={"yaw": {"max_pulse": 2000}})]})
+    assert config.turret_servos("left") == config.servos
+    assert config.turret_servos("right")["yaw"] == (500, 2000)
+    assert config.turret_servos("right")["pitch"] == config.servos["pitch"]
+
+
+@pytest.mark.parametrize("values, message", [
+    ({"detection_threshold": 1.5}, "detection_threshold must be between"),
+    ({"lock_time": "1"}, "lock_time must be a number"),
+    ({"aim_window_size": True}, "aim_window_size must be a number"),
+    ({"colour": "red"}, "Unknown setting: colour"),
+    ({"yaw_pid": {"kq": 1}}, "Unknown setting: yaw_pid.kq"),
+    ({"yaw_pid": 3}, "yaw_pid must be an object"),
+    ({"servos": {"yaw": {"min_pulse": 2000, "max_pulse": 1000}}}, "min_pulse must be less than max_pulse"),
+    ({"turrets": []}, "turrets must be a non-empty list"),
+    ({"turrets": ["turret"]}, "turrets[0] must be an object"),
+    ({"turrets": [turret(), turret()]}, "name must be a unique"),
+    ({"turrets": [turret("a"), turret("b")]}, "channel 0 is already in use"),
+    ({"turrets": [turret(pitch=1.5)]}, "channels.pitch must be a whole number"),
+    ({"turrets": [turret(pitch=16)]}, "channels.pitch must be between"),
+    ({"turrets": [turret(channels={"pitch": 0, "yaw": 1})]}, "channels must give pitch, yaw and fire"),
+    ({"turrets": [turret(camera_id=0)]}, "camera_id must be a string"),
+    ({"turrets": [turret(gun="big")]}, "Unknown setting: turrets[0].gun"),
+    ({"turrets": [turret(servos={"trigger": {}})]}, "Unknown setting: turrets[0].servos.trigger"),
+    ({"turrets": [turret(servos={"yaw": {"min_pulse": 2600}})]}, "turrets[0].servos.yaw.min_pulse must be between"),
+])
+def test_rejected(values, message):
+    with pytest.raises(ConfigError) as error:
+        TurretConfig(values)
+    assert message in str(error.value)
+
+
+def write(path, values):
+    with open(path, "w") as f:
+        json.dump(values, f)
+
+
+def test_reload_hands_over_once(tmp_path):
+    path = str(tmp_path / "turret_config.json")
+    write(path, {"lock_time": 1})
+    manager = ConfigManager(path)
+    assert manager.take_pending() is None
+    write(path, {"lock_time": 2})
+    assert manager.reload().lock_time == 2
+    assert manager.take_pending().lock_time == 2
+    assert manager.take_pending() is None
+    assert manager.current.lock_time == 2
+
+
+def test_bad_reload_keeps_current(tmp_path):
+    path = str(tmp_path / "turret_config.json")
+    write(path, {"lock_time": 1})
+    manager = ConfigManager(path)
+    with open(path, "w") as f:
+        f.write("{ not json")
+    with pytest.raises(ConfigError):
+        manager.reload()
+    write(path, {"lock_time": 100})
+    with pytest.raises(ConfigError):
+        manager.reload()
+    assert manager.take_pending() is None and manager.current.lock_time == 1
+
+
+def test_reload_rejects_turret_changes(tmp_path):
+    path = str(tmp_path / "turret_config.json")
+    write(path, {})
+    manager = ConfigManager(path)
+    write(path, {"turrets": [turret(pitch=5)]})
+    with pytest.raises(ConfigError, match="need a restart"):
+        manager.reload()
+    assert manager.take_pending() is None
+
+
+def test_missing_file_uses_defaults(tmp_path):
+    assert ConfigManager(str(tmp_path / "missing.json")).current.lock_time == DEFAULTS["lock_time"]
+
+
+def test_reload_accepts_per_turret_servo_changes(tmp_path):
+    path = str(tmp_path / "turret_config.json")
+    write(path, {})
+    manager = ConfigManager(path)
+    write(path, {"turrets": [turret(servos={"fire": {"min_pulse": 700}})]})
+    assert manager.reload().turret_servos("turret")["fire"] == (700, 2500)
@@ -0,0 +1,130 @@
+import numpy as np
+
+from manual_control import ManualControl
+from turret_config import TurretConfig
+from turret_controller import TurretController, TurretUnit
+from turret_state_machine import TurretStateMachine
+
+
+class FakeServo:
+    def __init__(self):
+        self.angle = 0.0
+        self.pulls = 0
+
+    def get_angle(self):
+        return self.angle
+
+    def set_angle(self, angle):
+        self.angle = angle
+
+    def adjust_angle(self, delta):
+        self.angle += delta
+
+    def max(self):
+        self.pulls += 1
+
+    def mid(self):
+        pass
+
+    def set_pulse_range(self, min_pulse, max_pulse):
+        self.pulse_range = (min_pulse, max_pulse)
+
+
+class FakeChannel:
+    def __init__(self, manual_control=None):
+        self.armed = True
+        self.mode = 'auto'
+        self.manual_control = manual_control
+
+
+class OnePerson:
+    """ A single person standing right in the middle of the frame. """
+    def detections(self):
+        keypoints = np.zeros((1, 17, 3), dtype=np.float32)
+        keypoints[0, :, :] = (320, 240, 0.9)
+        return keypoints, None, np.array([0.9])
+
+
+class Nobody:
+    def detections(self):
+        return None, None, None
+
+
+def make_unit(name, source=None, manual_control=None):
+    turret = TurretStateMachine(FakeServo(), FakeServo(), FakeServo())
+    turret.lock_time = 0
+    turret.TRIGGER_TIME = 0
+    return TurretUnit(name, turret, source or OnePerson(), FakeChannel(manual_control))
+
+
+def run_ticks(controller, ticks=40):
+    for _ in range(ticks):
+        controller.tick()
+
+
+def test_single_turret_fires():
+    controller = TurretController()
+    unit = make_unit('a')
+    controller.add(unit)
+    run_ticks(controller)
+    assert unit.turret.fire_servo.pulls > 0
+
+
+def test_two_turrets_one_target_only_one_fires():
+    controller = TurretController()
+    units = [make_unit('a'), make_unit('b')]
+    for unit in units:
+        controller.add(unit)
+    run_ticks(controller)
+    pulls = [unit.turret.fire_servo.pulls for unit in units]
+    assert sum(1 for p in pulls if p > 0) == 1, pulls
+
+
+def test_other_turret_takes_over_after_claim_expires():
+    controller = TurretController()
+    controller.claim_grace = 0
+    units = [make_unit('a'), make_unit('b')]
+    for unit in units:
+        controller.add(unit)
+    run_ticks(controller)
+    assert all(unit.turret.fire_servo.pulls > 0 for unit in units)
+
+
+def test_commands_sent_in_auto_are_dropped():
+    manual_control = ManualControl()
+    controller = TurretController()
+    unit = make_unit('a', Nobody(), manual_control)
+    controller.add(unit)
+    manual_control.submit(5, 0, fire=True)
+    run_ticks(controller, 20)
+    unit.channel.mode = 'manual'
+    run_ticks(controller, 2)
+    assert unit.turret.fire_servo.pulls == 0
+
+
+def test_commands_wait_for_the_switch_to_manual():
+    manual_control = ManualControl()
+    controller = TurretController()
+    unit = make_unit('a', Nobody(), manual_control)
+    controller.add(unit)
+    run_ticks(controller, 1)
+    unit.channel.mode = 'manual'
+    manual_control.submit(0, 0, fire=True)
+    # A wakeup before the next tick must not throw the command away
+    controller.apply_manual_commands()
+    run_ticks(controller, 1)
+    assert unit.turret.fire_servo.pulls == 1
+
+
+def test_apply_config_uses_each_turrets_servos():
+    controller = TurretController()
+    left, right = make_unit('left'), make_unit('right')
+    controller.add(left)
+    controller.add(right)
+    turrets = [{"name": "left", "channels": {"pitch": 0, "yaw": 1, "fire": 2}},
+               {"name": "right", "channels": {"pitch": 3, "yaw": 4, "fire": 5},
+                "servos": {"yaw": {"min_pulse": 600, "max_pulse": 2400}}}]
+    controller.apply_config(TurretConfig({"turrets": turrets}))
+    assert left.turret.yaw_servo.pulse_range == (500, 2500)
+    assert right.turret.yaw_servo.pulse_range == (600, 2400)
+    assert right.turret.pitch_servo.pulse_range == (1000, 2000)
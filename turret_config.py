@@ -0,0 +1,232 @@
+import copy
+import json
+import threading
+import time
+
+"""
+Tunable turret settings loaded from a JSON file.
+A reload parses and checks the whole file first and only then hands the new config to the control
+loop, which swaps it in between ticks.  A bad edit is reported and the old settings stay in use.
+The camera pipeline is never restarted.
+"""
+
+DEFAULT_CONFIG_PATH = "turret_config.json"
+
+DEFAULTS = {
+    "detection_threshold": 0.1,
+    "aim_window_size": 50,
+    "lock_time": 1.5,
+    "yaw_pid": {"kp": 0.1, "ki": 0.01, "kd": 0.05, "output_limit": 20},
+    "pitch_pid": {"kp": 0.1, "ki": 0.01, "kd": 0.05, "output_limit": 20},
+    "search_limit": 55,
+    "search_step": 5,
+    "search_pitch": 15,
+    "servos": {
+        "pitch": {"min_pulse": 1000, "max_pulse": 2000},
+        "yaw": {"min_pulse": 500, "max_pulse": 2500},
+        "fire": {"min_pulse": 500, "max_pulse": 2500},
+    },
+    "horizontal_fov": 66,
+    "deconflict_tolerance": 5,
+    # Changes to the turret layout only take effect after a restart
+    "turrets": [
+        {"name": "turret", "camera_id": "", "mount_yaw": 0, "channels": {"pitch": 0, "yaw": 1, "fire": 2}},
+    ],
+}
+
+# servos is optional, an entry overrides the top level servos for turrets with different servos
+TURRET_DEFAULTS = {"name": None, "camera_id": "", "mount_yaw": 0, "channels": None, "servos": {}}
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class TurretConfig:
+    def __init__(self, values=None):
+        """
+        Builds a config from a dict, anything missing falls back to DEFAULTS.
+
+        :param values: Settings read from the config file
+        :raises ConfigError: if a setting is unknown or out of range
+        """
+        merged = _merge(DEFAULTS, values or {}, "")
+        self.values = merged
+        self.detection_threshold = _number(merged, "detection_threshold", 0, 1)
+        self.aim_window_size = int(_number(merged, "aim_window_size", 1, 240))
+        self.lock_time = _number(merged, "lock_time", 0, 60)
+        self.yaw_pid = _pid(merged["yaw_pid"], "yaw_pid")
+        self.pitch_pid = _pid(merged["pitch_pid"], "pitch_pid")
+        self.search_limit = _number(merged, "search_limit", 0, 90)
+        self.search_step = _number(merged, "search_step", 0, 45)
+        self.search_pitch = _number(merged, "search_pitch", -90, 90)
+        self.servos = _servos(merged["servos"], "servos.")
+        self.horizontal_fov = _number(merged, "horizontal_fov", 1, 180)
+        self.deconflict_tolerance = _number(merged, "deconflict_tolerance", 0, 180)
+        self.turrets = _turrets(merged["turrets"], merged["servos"])
+
+    def turret_servos(self, name):
+        """ Pulse ranges {servo: (min, max)} for the named turret, with its own overrides applied. """
+        for turret in self.turrets:
+            if turret["name"] == name:
+                return turret["servos"]
+        return self.servos
+
+    def to_dict(self):
+        return copy.deepcopy(self.values)
+
+
+def _merge(defaults, values, prefix):
+    if not isinstance(values, dict):
+        raise ConfigError(f"{prefix.rstrip('.') or 'config'} must be an object")
+    merged = copy.deepcopy(defaults)
+    for key, value in values.items():
+        if key not in defaults:
+            raise ConfigError(f"Unknown setting: {prefix}{key}")
+        if isinstance(defaults[key], dict):
+            merged[key] = _merge(defaults[key], value, f"{prefix}{key}.")
+        else:
+            merged[key] = value
+    return merged
+
+
+def _number(values, key, low, high, prefix=""):
+    value = values[key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ConfigError(f"{prefix}{key} must be a number")
+    if not low <= value <= high:
+        raise ConfigError(f"{prefix}{key} must be between {low} and {high}")
+    return value
+
+
+def _pid(values, name):
+    return (_number(values, "kp", 0, 100, f"{name}."),
+            _number(values, "ki", 0, 100, f"{name}."),
+            _number(values, "kd", 0, 100, f"{name}."),
+            _number(values, "output_limit", 0, 90, f"{name}."))
+
+
+def _servos(values, prefix):
+    servos = {}
+    for name, pulses in values.items():
+        min_pulse = _number(pulses, "min_pulse", 500, 2500, f"{prefix}{name}.")
+        max_pulse = _number(pulses, "max_pulse", 500, 2500, f"{prefix}{name}.")
+        if min_pulse >= max_pulse:
+            raise ConfigError(f"{prefix}{name}.min_pulse must be less than max_pulse")
+        servos[name] = (int(min_pulse), int(max_pulse))
+    return servos
+
+
+def _layout(turret):
+    """ The parts of a turret entry that are only read at startup. """
+    return {key: value for key, value in turret.items() if key != "servos"}
+
+
+def _turrets(entries, servos):
+    if not isinstance(entries, list) or not entries:
+        raise ConfigError("turrets must be a non-empty list")
+    turrets = []
+    names = set()
+    used_channels = set()
+    for index, entry in enumerate(entries):
+        prefix = f"turrets[{index}]."
+        if not isinstance(entry, dict):
+            raise ConfigError(f"turrets[{index}] must be an object")
+        unknown = set(entry) - set(TURRET_DEFAULTS)
+        if unknown:
+            raise ConfigError(f"Unknown setting: {prefix}{sorted(unknown)[0]}")
+        turret = dict(TURRET_DEFAULTS, **entry)
+        if not isinstance(turret["name"], str) or not turret["name"] or turret["name"] in names:
+            raise ConfigError(f"{prefix}name must be a unique, non-empty string")
+        names.add(turret["name"])
+        if not isinstance(turret["camera_id"], str):
+            raise ConfigError(f"{prefix}camera_id must be a string")
+        _number(turret, "mount_yaw", -180, 180, prefix)
+        channels = turret["channels"]
+        if not isinstance(channels, dict) or set(channels) != {"pitch", "yaw", "fire"}:
+            raise ConfigError(f"{prefix}channels must give pitch, yaw and fire channels")
+        # Copy so the ints written back below don't land in the caller's (or the defaults') dict
+        channels = turret["channels"] = dict(channels)
+        for servo in channels:
+            channel = _number(channels, servo, 0, 15, f"{prefix}channels.")
+            if channel != int(channel):
+                raise ConfigError(f"{prefix}channels.{servo} must be a whole number")
+            # The channel ends up in a register address, 4.0 has to become 4
+            channel = channels[servo] = int(channel)
+            if channel in used_channels:
+                raise ConfigError(f"{prefix}channels.{servo}: channel {channel} is already in use")
+            used_channels.add(channel)
+        # Partial overrides merge over the top level servos, the result is resolved to pulse ranges
+        turret["servos"] = _servos(_merge(servos, turret["servos"], f"{prefix}servos."), f"{prefix}servos.")
+        turrets.append(turret)
+    return turrets
+
+
+class ConfigManager:
+    def __init__(self, path=DEFAULT_CONFIG_PATH):
+        """
+        Initializes the ConfigManager object and loads the file (defaults are used if it doesn't exist).
+
+        :param path: Path of the JSON config file
+        """
+        self.path = path
+        self.current = self._read()
+        # The turrets are built once at startup, a reload can't add, remove or rewire them (servo ranges can change)
+        self.startup_turrets = self.current.turrets
+        self._pending = None
+        self._lock = threading.Lock()
+        self.watcher = None
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                values = json.load(f)
+        except FileNotFoundError:
+            values = {}
+        except json.JSONDecodeError as e:
+            raise ConfigError(f"{self.path}: {e}") from e
+        return TurretConfig(values)
+
+    def reload(self):
+        """
+        Re-reads the config file and queues it for the control loop.
+
+        :return: The new TurretConfig
+        :raises ConfigError: if the file is invalid or changes the turrets, the current config is kept
+        """
+        start = time.perf_counter()
+        try:
+            config = self._read()
+            if [_layout(t) for t in config.turrets] != [_layout(t) for t in self.startup_turrets]:
+                raise ConfigError("turrets changes need a restart")
+        except ConfigError as e:
+            print(f"Config reload failed, keeping current settings: {e}")
+            raise
+        with self._lock:
+            self._pending = config
+        print(f"Config reloaded from {self.path} in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return config
+
+    def take_pending(self):
+        """ Returns a newly loaded config exactly once, or None. Called by the control loop between ticks. """
+        with self._lock:
+            config, self._pending = self._pending, None
+        if config is not None:
+            self.current = config
+        return config
+
+    def start_watching(self):
+        """ Reloads the config whenever the file changes. """
+        from file_watcher import FileWatcher
+
+        def reload_quietly():
+            try:
+                self.reload()
+            except ConfigError:
+                pass
+        self.watcher = FileWatcher([self.path], reload_quietly).start()
+
+    def stop_watching(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
@@ -0,0 +1,190 @@
+import threading
+import time
+
+from turret_state_machine import TurretState
+
+WINDOW_CENTER_X = 320
+
+"""
+Runs any number of turrets from one control loop.
+Each tick every turret is updated from its own detection source, targets are deconflicted so two
+turrets don't engage the same person, and then the shared servo bus is flushed once so all the
+channel changes go out together.  Between ticks the loop only wakes up to apply manual commands.
+"""
+
+class TurretUnit:
+    def __init__(self, name, turret, source, channel, mount_yaw=0.0):
+        """
+        One turret in the controller.
+
+        :param name: Name used in the web page and URLs
+        :param turret: TurretStateMachine driving this turret's servos
+        :param source: Object with a detections() method returning (keypoints, boxes, scores)
+        :param channel: streamer.TurretChannel with the web controls for this turret
+        :param mount_yaw: Direction (degrees) the turret faces when its yaw servo is centered
+        """
+        self.name = name
+        self.turret = turret
+        self.source = source
+        self.channel = channel
+        self.mount_yaw = mount_yaw
+
+
+class TurretController:
+    ENGAGED_STATES = (TurretState.TRACKING, TurretState.LOCKED, TurretState.FIRING)
+    # States that win an unclaimed target over a turret that is only tracking
+    CLAIMING_STATES = (TurretState.LOCKED, TurretState.FIRING)
+
+    def __init__(self, bus=None, config_manager=None, event_log=None, period=0.25,
+                 detection_threshold_override=None):
+        """
+        Initializes the TurretController object.
+
+        :param bus: ServoBus shared by the turrets, flushed once per tick (None if servos write directly)
+        :param config_manager: ConfigManager whose reloads are applied between ticks
+        :param event_log: EventLog shared by the turrets
+        :param period: Seconds per control tick
+        :param detection_threshold_override: Threshold that wins over the config file, if set
+        """
+        self.bus = bus
+        self.config_manager = config_manager
+        self.event_log = event_log
+        self.period = period
+        self.detection_threshold_override = detection_threshold_override
+        self.units = []
+        self.horizontal_fov = 66
+        self.deconflict_tolerance = 5
+        # Seconds a turret keeps its target's bearing after it stops engaging (e.g. just after firing)
+        self.claim_grace = 1.0
+        self._claims = {}  # unit index -> (bearing, time it was last engaged on it)
+        # Set by the turrets' ManualControls so manual commands don't wait for the next tick
+        self.manual_wakeup = threading.Event()
+        self.overruns = 0
+        self._stop = threading.Event()
+
+    def add(self, unit):
+        self.units.append(unit)
+        unit.turret.turret_id = len(self.units) - 1
+
+    def apply_config(self, config):
+        """ Applies a TurretConfig to every turret, only call between ticks. """
+        self.horizontal_fov = config.horizontal_fov
+        self.deconflict_tolerance = config.deconflict_tolerance
+        threshold = self.detection_threshold_override
+        for unit in self.units:
+            unit.turret.apply_config(config)
+            if threshold is None:
+                unit.source.detection_threshold = config.detection_threshold
+            else:
+                unit.source.detection_threshold = threshold
+            servos = config.turret_servos(unit.name)
+            for name in ('pitch', 'yaw', 'fire'):
+                servo = getattr(unit.turret, f"{name}_servo")
+                if hasattr(servo, 'set_pulse_range'):
+                    servo.set_pulse_range(*servos[name])
+        if self.bus:
+            self.bus.flush()
+
+    def apply_manual_commands(self):
+        """ Sends any waiting manual commands to the servos. """
+        self.manual_wakeup.clear()
+        applied = []
+        for unit in self.units:
+            manual_control = unit.channel.manual_control
+            if manual_control is None:
+                continue
+            if unit.turret.state != TurretState.MANUAL:
+                # Commands wait for the next tick only if the page has just switched to manual, anything
+                # else (say a second tab still in manual) is dropped so a latched fire can't go off later
+                if unit.channel.mode != 'manual':
+                    manual_control.discard()
+                continue
+            command = manual_control.take(timeout=0)
+            if command is not None:
+                unit.turret.manual_aim(command.yaw, command.pitch)
+                if command.fire:
+                    unit.turret.manual_fire()
+                applied.append((unit, command))
+        if not applied:
+            return
+        if self.bus:
+            self.bus.flush()
+        for unit, command in applied:
+            unit.channel.manual_control.applied(command)
+
+    def tick(self):
+        """ Updates every turret once and writes all their servo changes together. """
+        if self.config_manager:
+            # New settings are swapped in here, between ticks
+            new_config = self.config_manager.take_pending()
+            if new_config is not None:
+                self.apply_config(new_config)
+        for unit in self.units:
+            unit.turret.set_manual(unit.channel.mode == 'manual')
+        self.apply_manual_commands()
+        for unit in self.units:
+            keypoints, boxes, scores = unit.source.detections()
+            unit.turret.update(keypoints, boxes, scores, unit.channel.armed)
+        self.deconflict()
+        if self.bus:
+            self.bus.flush()
+
+    def target_bearing(self, unit):
+        """ Direction (degrees) of the turret's current target in the shared frame. """
+        aim_x = unit.turret.aim_point[0]
+        return unit.mount_yaw + unit.turret.yaw_servo.get_angle() + \
+               (aim_x - WINDOW_CENTER_X) / (WINDOW_CENTER_X * 2) * self.horizontal_fov
+
+    def deconflict(self):
+        """
+        Stops two turrets engaging the same target.  The turrets share one PCA9685 so they sit close
+        together and a target's bearing is about the same from each.  A turret that has claimed a
+        bearing keeps it while it is engaged and for claim_grace seconds after, so the owner can
+        fire (which drops it back to searching for a tick) and re-acquire without losing the target.
+        Unclaimed targets go to locked or firing turrets first, then turrets in the order they were
+        added.  A turret that loses moves on to its next person if it can see one, and holds fire
+        until it has a target of its own.
+        """
+        now = time.monotonic()
+        engaged = {}
+        for i, unit in enumerate(self.units):
+            unit.turret.hold_fire = False
+            if unit.turret.state in self.ENGAGED_STATES and unit.turret.aim_point[0] >= 0:
+                engaged[i] = self.target_bearing(unit)
+        self._claims = {i: claim for i, claim in self._claims.items()
+                        if i in engaged or now - claim[1] <= self.claim_grace}
+        # Claims held by owners that are off target for a moment still block the others
+        claimed = {i: bearing for i, (bearing, _) in self._claims.items() if i not in engaged}
+        order = sorted(engaged, key=lambda i: (i not in self._claims,
+                                               self.units[i].turret.state not in self.CLAIMING_STATES, i))
+        for i in order:
+            turret = self.units[i].turret
+            bearing = engaged[i]
+            if any(abs(bearing - other) <= self.deconflict_tolerance for other in claimed.values()):
+                turret.hold_fire = True
+                if turret.keypoints is not None and len(turret.keypoints) > 1:
+                    turret.target += 1
+            else:
+                claimed[i] = bearing
+                self._claims[i] = (bearing, now)
+
+    def run(self):
+        """ Ticks at a fixed rate until stop() is called. """
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            self.tick()
+            next_tick += self.period
+            while True:
+                remaining = next_tick - time.monotonic()
+                if remaining <= 0:
+                    break
+                if self.manual_wakeup.wait(remaining):
+                    self.apply_manual_commands()
+            if time.monotonic() - next_tick > self.period:
+                # Fell more than a tick behind, start counting from now rather than bursting to catch up
+                self.overruns += 1
+                next_tick = time.monotonic()
+
+    def stop(self):
+        self._stop.set()
+
@@ -1,15 +1,16 @@
 import time
 from enum import Enum, auto
 from threading import Thread
-from time import sleep
 import numpy as np
 from simple_pid import PID  # Import the PID library
+from event_log import EventLog, EventType, LogLevel
 
 class TurretState(Enum):
     SEARCHING = auto()
     TRACKING = auto()
     LOCKED = auto()
     FIRING = auto()
+    MANUAL = auto()
 
 class TurretStateMachine:
     AIM_WINDOW_SIZE = 50
@@ -21,7 +22,11 @@ class TurretStateMachine:
         (45, -90), (45, -45), (45, 0), (45, 45), (45, 90)
     ]
 
-    def __init__(self, pitch_servo, yaw_servo, fire_servo, search_coords=None):
+    TRIGGER_TIME = 0.22  # Seconds the fire servo is held at max
+    TARGET_SCORE = 0.1  # People scoring above this are targets
+
+    def __init__(self, pitch_servo, yaw_servo, fire_servo, search_coords=None, event_log=None, config=None,
+                 turret_id=0):
         self.state = TurretState.SEARCHING
         self.pitch_servo = pitch_servo
         self.yaw_servo = yaw_servo
@@ -38,9 +43,34 @@ class TurretStateMachine:
         self.pitch_pid = PID(0.1, 0.01, 0.05, setpoint=240)  # PID for pitch (center Y = 240)
         self.yaw_pid.output_limits = (-20, 20)  # Limit yaw adjustments
         self.pitch_pid.output_limits = (-20, 20)  # Limit pitch adjustments
+        # Logging goes through the event log so the control thread never waits on stdout
+        self.event_log = event_log or EventLog(level=LogLevel.OFF)
+        self.lock_time = 1.5
+        self.search_limit = 55
+        self.search_pitch = 15
+        self.turret_id = turret_id
+        self.trigger_time = None
+        # Set by a TurretController when another turret has already claimed this target
+        self.hold_fire = False
+        if config is not None:
+            self.apply_config(config)
+
+    def apply_config(self, config):
+        """ Applies a TurretConfig, call between updates so a tick never sees half of one. """
+        self.AIM_WINDOW_SIZE = config.aim_window_size
+        self.lock_time = config.lock_time
+        self.search_limit = config.search_limit
+        self.search_pitch = config.search_pitch
+        # Keep the current sweep direction
+        self.searchDeltaX = config.search_step if self.searchDeltaX >= 0 else -config.search_step
+        for pid, (kp, ki, kd, limit) in ((self.yaw_pid, config.yaw_pid), (self.pitch_pid, config.pitch_pid)):
+            pid.tunings = (kp, ki, kd)
+            pid.output_limits = (-limit, limit)
 
     def set_state(self, new_state):
-        print(f"Transitioning to state: {new_state}")
+        self.event_log.record(LogLevel.INFO, EventType.TRANSITION, self.state.value, new_state.value,
+                              self.aim_point, yaw_angle=self.yaw_servo.get_angle(),
+                              pitch_angle=self.pitch_servo.get_angle(), turret=self.turret_id)
         self.state = new_state
 
     def update(self, keypoints, boxes, scores, armed_state):
@@ -48,7 +78,8 @@ class TurretStateMachine:
         self.boxes = boxes
         self.scores = scores
         self.armed = armed_state
-        self.target_found = scores is not None and np.any(scores > 0.1)
+        self.release_trigger()
+        self.target_found = scores is not None and np.any(scores > self.TARGET_SCORE)
         if self.target_found:
             self.update_aimpoint()
         else:
@@ -58,6 +89,7 @@ class TurretStateMachine:
             TurretState.TRACKING: self.track,
             TurretState.LOCKED: self.lock,
             TurretState.FIRING: self.fire_turret,
+            TurretState.MANUAL: self.manual,
         }
         handler = state_handlers.get(self.state)
         if handler:
@@ -69,12 +101,12 @@ class TurretStateMachine:
         if self.target_found:
             self.set_state(TurretState.TRACKING)
         else:
-            if(self.yaw_servo.get_angle() + self.searchDeltaX > 55 or
-                self.yaw_servo.get_angle() + self.searchDeltaX < -55):
+            if(self.yaw_servo.get_angle() + self.searchDeltaX > self.search_limit or
+                self.yaw_servo.get_angle() + self.searchDeltaX < -self.search_limit):
                  self.searchDeltaX = -self.searchDeltaX
             self.yaw_servo.adjust_angle(self.searchDeltaX)
 
-            self.pitch_servo.set_angle(15)
+            self.pitch_servo.set_angle(self.search_pitch)
 
     def track(self):
         if not self.target_found:
@@ -99,19 +131,63 @@ class TurretStateMachine:
         
         if self.locked_time is None:
             self.locked_time = time.time()
-        elif time.time() - self.locked_time > 1.5 and self.armed:
+        elif time.time() - self.locked_time > self.lock_time and self.armed and not self.hold_fire:
             self.set_state(TurretState.FIRING)
         if not self.target_found:
             self.set_state(TurretState.SEARCHING)
 
     def fire_turret(self):
-        if self.armed:
-            self.fire_servo.max()
-            sleep(0.22)
-            self.fire_servo.mid()
+        if self.hold_fire:
+            self.set_state(TurretState.TRACKING)
+        elif self.armed:
+            self.pull_trigger()
             self.target = self.target + 1
             self.set_state(TurretState.SEARCHING)
 
+    def pull_trigger(self):
+        """ Moves the fire servo to max, release_trigger() brings it back on a later update. """
+        if self.trigger_time is not None:
+            return
+        self.event_log.record(LogLevel.INFO, EventType.FIRE, self.state.value, self.state.value,
+                              self.aim_point, yaw_angle=self.yaw_servo.get_angle(),
+                              pitch_angle=self.pitch_servo.get_angle(), turret=self.turret_id)
+        self.fire_servo.max()
+        # Don't sleep here, it would stall every turret sharing the control loop
+        self.trigger_time = time.time()
+
+    def release_trigger(self):
+        if self.trigger_time is not None and time.time() - self.trigger_time >= self.TRIGGER_TIME:
+            self.fire_servo.mid()
+            self.trigger_time = None
+
+    def set_manual(self, manual):
+        """ Switches between manual control and autonomous searching. """
+        if manual and self.state != TurretState.MANUAL:
+            self.set_state(TurretState.MANUAL)
+        elif not manual and self.state == TurretState.MANUAL:
+            # Don't let integral windup from before manual control kick the servos
+            self.yaw_pid.reset()
+            self.pitch_pid.reset()
+            self.set_state(TurretState.SEARCHING)
+
+    def manual(self):
+        # Commands are applied through manual_aim() as they arrive, nothing to do on a tick
+        pass
+
+    def manual_aim(self, yaw_delta, pitch_delta):
+        """ Moves the servos by a manual command, using the same servo path as aim(). """
+        if self.state != TurretState.MANUAL:
+            return
+        self.yaw_servo.adjust_angle(yaw_delta)
+        self.pitch_servo.adjust_angle(pitch_delta)
+        self.event_log.record(LogLevel.DEBUG, EventType.AIM, self.state.value, self.state.value,
+                              self.aim_point, yaw_angle=self.yaw_servo.get_angle(),
+                              pitch_angle=self.pitch_servo.get_angle(), turret=self.turret_id)
+
+    def manual_fire(self):
+        if self.state == TurretState.MANUAL and self.armed:
+            self.pull_trigger()
+
     def is_locked(self):
         aim_x, aim_y = self.aim_point
         return ((640/2)-self.AIM_WINDOW_SIZE) < aim_x < ((640/2)+self.AIM_WINDOW_SIZE) and \
@@ -122,10 +198,12 @@ class TurretStateMachine:
         # Use PID controllers to calculate adjustments
         yaw_adjustment = self.yaw_pid(aim_x)
         pitch_adjustment = self.pitch_pid(aim_y)
-        print(yaw_adjustment * -1, pitch_adjustment)
         # Apply adjustments to servos
         self.yaw_servo.adjust_angle(yaw_adjustment * -1)
         self.pitch_servo.adjust_angle(pitch_adjustment)
+        self.event_log.record(LogLevel.DEBUG, EventType.AIM, self.state.value, self.state.value,
+                              self.aim_point, self.yaw_pid.components, self.pitch_pid.components,
+                              self.yaw_servo.get_angle(), self.pitch_servo.get_angle(), turret=self.turret_id)
 
     def update_aimpoint(self):
         # use keypoints to identify target aim point between the shoulders
@@ -134,7 +212,7 @@ class TurretStateMachine:
         if self.keypoints is not None and len(self.keypoints) > 0:
             if self.target >= len(self.keypoints):
                 self.target = 0
-            if self.scores[self.target] < 0.1:
+            if self.scores[self.target] < self.TARGET_SCORE:
                 self.target = 0
             target_keypoints = self.keypoints[self.target]
             if target_keypoints[LEFT_SHOULDER][2] > 0.1 and target_keypoints[RIGHT_SHOULDER][2] > 0.1:
@@ -0,0 +1,89 @@
+import base64
+import hashlib
+import struct
+
+"""
+Just enough of RFC 6455 to run a WebSocket inside http.server's request handler.
+Handles the handshake, masked client frames, ping/pong and close.  Fragmented messages
+aren't supported, browsers don't fragment the small messages the web page sends.
+"""
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+CLOSE_INVALID_DATA = 1007
+CLOSE_TOO_BIG = 1009
+
+# The page only sends small JSON commands, anything bigger is a broken or hostile client
+MAX_PAYLOAD = 4096
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+def accept_key(key):
+    """ Computes the Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key. """
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def is_upgrade_request(headers):
+    return 'websocket' in headers.get('Upgrade', '').lower() and \
+           headers.get('Sec-WebSocket-Key') is not None
+
+
+def _read_exact(rfile, n):
+    data = rfile.read(n)
+    if len(data) < n:
+        raise ConnectionError("WebSocket closed mid-frame")
+    return data
+
+
+def read_frame(rfile, max_payload=MAX_PAYLOAD):
+    """
+    Reads one frame from the client.
+
+    :param max_payload: Largest payload accepted, bigger frames raise FrameTooLarge before it is read
+    :return: (opcode, payload bytes)
+    """
+    b1, b2 = _read_exact(rfile, 2)
+    opcode = b1 & 0x0F
+    masked = b2 & 0x80
+    length = b2 & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', _read_exact(rfile, 2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', _read_exact(rfile, 8))[0]
+    if length > max_payload:
+        raise FrameTooLarge(f"WebSocket frame of {length} bytes is over the {max_payload} byte limit")
+    mask = _read_exact(rfile, 4) if masked else None
+    payload = _read_exact(rfile, length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+def close_payload(code, reason=''):
+    """ Builds the payload of a close frame with a status code. """
+    return struct.pack('!H', code) + reason.encode('utf-8')[:120]
+
+
+def write_frame(wfile, payload, opcode=OPCODE_TEXT):
+    """ Sends one unmasked frame to the client. """
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    wfile.write(header + payload)
+    wfile.flush()